@@ -1,12 +1,31 @@
 import secrets
 
-from helpfunctions import concat, generate_two_large_distinct_primes, hash_to_prime, bezoute_coefficients,\
-    mul_inv, shamir_trick, calculate_product
+from helpfunctions import concat, hash_to_prime, shamir_trick
+from keygen import generate_two_large_distinct_primes
+from fixed_base import DEFAULT_MAX_BITS, FixedBaseTable
+from keystore import KEYSTORE_PATH, load_or_create_keystore
+from product_tree import calculate_product, product_tree, tree_root_factor
+from trapdoor import Trapdoor
+from prime_cache import PrimeCache
+from member_product import MemberProduct
+from witness_aggregation import aggregate_witnesses
+from witness_stream import stream_root_factor
+from xgcd import bezoute_coefficients, mul_inv
 
 RSA_KEY_SIZE = 3072  # RSA key size 
 RSA_PRIME_SIZE = int(RSA_KEY_SIZE / 2)
 ACCUMULATED_PRIME_SIZE = 128  
 
+# primes of the accumulated elements, so the provers do not redo hash_to_prime for every element of S.
+# Call prime_cache.save() to persist it.
+prime_cache = PrimeCache()
+
+# (base, n) -> FixedBaseTable, see use_fixed_base
+fixed_base_tables = dict()
+
+# product of the primes of S for the non-membership proofs, the delete functions here invalidate it.
+member_product = MemberProduct()
+
 def setup():
     p, q = generate_two_large_distinct_primes(RSA_PRIME_SIZE)
     n = p*q
@@ -14,94 +33,155 @@ def setup():
     return n, A0, dict()
 
 
-def add(A, S, x, n):
+# Setup for a trusted accumulator manager: same as setup(), but keeps the factorization of n.
+# The returned trapdoor can be passed to the prover-side functions (trapdoor=...) to reduce their
+# exponents mod lambda(n) and run them as CRT exponentiations. It must never reach the verifiers.
+def setup_manager():
+    p, q = generate_two_large_distinct_primes(RSA_PRIME_SIZE)
+    n = p*q
+    A0 = secrets.randbelow(n)
+    return n, A0, dict(), Trapdoor(p, q)
+
+
+# setup() that runs only once: (n, A0) are kept in the keystore and loaded on the next runs.
+# Returns the trapdoor as well (None unless keep_trapdoor was set when the keystore was created).
+# fixed_base - keep a fixed-base table for A0 (see use_fixed_base), up to fixed_base_max_bits of exponent
+def setup_from_keystore(path=KEYSTORE_PATH, keep_trapdoor=False, fixed_base=False,
+                        fixed_base_max_bits=DEFAULT_MAX_BITS):
+    n, A0, trapdoor = load_or_create_keystore(RSA_PRIME_SIZE, path, keep_trapdoor)
+    if fixed_base:
+        use_fixed_base(A0, n, max_bits=fixed_base_max_bits)
+    return n, A0, dict(), trapdoor
+
+
+# Keeps a fixed-base table (fixed_base.py) for g mod n: every exponentiation of g by the prover-side functions
+# here (prove_membership, batch_prove_membership, delete, batch_delete, create_all_membership_witnesses...)
+# then goes through it. Meant for A0, which never changes for a deployment, right after setup.
+# precompute_bits - exponent size to build the table for now, it grows on demand otherwise
+# max_bits - largest exponent the table grows to (fixed_base.DEFAULT_MAX_BITS covers ~8000 elements, ~50 MB for a
+# 3072-bit modulus), a larger exponent is done partly with pow
+def use_fixed_base(g, n, precompute_bits=0, max_bits=DEFAULT_MAX_BITS):
+    table = fixed_base_tables.get((g, n))
+    if table is None:
+        table = FixedBaseTable(g, n, max_bits=max_bits)
+        fixed_base_tables[(g, n)] = table
+    table.extend(precompute_bits)
+    return table
+
+
+def add(A, S, x, n, trapdoor=None):
     if x in S.keys():
         return A
     else:
         hash_prime, nonce = hash_to_prime(x, ACCUMULATED_PRIME_SIZE)
-        A = pow(A, hash_prime, n)
+        prime_cache.put(x, hash_prime, nonce)
+        A = __power(A, hash_prime, n, trapdoor)
         S[x] = nonce
         return A
 
 
-def batch_add(A_pre_add, S, x_list, n):
-    product = 1
+def batch_add(A_pre_add, S, x_list, n, trapdoor=None):
+    primes = []
     for x in x_list:
         if x not in S.keys():
             hash_prime, nonce = hash_to_prime(x, ACCUMULATED_PRIME_SIZE)
+            prime_cache.put(x, hash_prime, nonce)
             S[x] = nonce
-            product *= hash_prime
-    A_post_add = pow(A_pre_add, product, n)
-    return A_post_add, prove_exponentiation(A_pre_add, product, A_post_add, n)
+            primes.append(hash_prime)
+    product = calculate_product(primes)
+    A_post_add = __power(A_pre_add, product, n, trapdoor)
+    return A_post_add, prove_exponentiation(A_pre_add, product, A_post_add, n, trapdoor)
 
 
-def prove_membership(A0, S, x, n):
+def prove_membership(A0, S, x, n, trapdoor=None):
     if x not in S.keys():
         return None
     else:
-        product = 1
+        primes = []
         for element in S.keys():
             if element != x:
                 nonce = S[element]
-                product *= hash_to_prime(element, ACCUMULATED_PRIME_SIZE, nonce)[0]
-        A = pow(A0, product, n)
+                primes.append(element_prime(element, nonce))
+        A = __power(A0, calculate_product(primes), n, trapdoor)
         return A
 
 
-def prove_non_membership(A0, S, x, x_nonce, n):
-    if x in S.keys():
-        return None
-    else:
-        product = 1
-        for element in S.keys():
-            nonce = S[element]
-            product *= hash_to_prime(element, ACCUMULATED_PRIME_SIZE, nonce)[0]
+def prove_non_membership(A0, S, x, x_nonce, n, trapdoor=None):
+    return batch_prove_non_membership(A0, S, [x], [x_nonce], n, trapdoor)
+
+
+def verify_non_membership(A0, A_final, d, b, x, x_nonce, n):
     prime = hash_to_prime(x, ACCUMULATED_PRIME_SIZE, x_nonce)[0]
-    a, b = bezoute_coefficients(prime, product)
+    return __verify_non_membership(A0, A_final, d, b, prime, n)
+
+
+# Aggregated non-membership witness (BBF18) for all of x_list: with X the product of their primes and P the
+# product of the primes of S, a*X + b*P = 1 and d = A0^a, verified as d^X * A^b == A0.
+# The Bezout coefficients are computed for X and P mod X (with P = q*X + r and u*X + v*r = 1: a = u - v*q,
+# b = v), so the extended GCD runs on numbers of the size of X and the only step of the size of P is the
+# exponentiation of A0: a batch costs about the same as a single proof. P is kept in member_product.
+# Returns None if an element of x_list is in S.
+def batch_prove_non_membership(A0, S, x_list, x_nonces_list, n, trapdoor=None):
+    if any(x in S.keys() for x in x_list):
+        return None
+    product = member_product.get(S, element_prime)
+    primes_product = __calculate_primes_product(x_list, x_nonces_list)
+    if primes_product is None:
+        return None
+    q, r = divmod(product, primes_product)
+    u, v = bezoute_coefficients(primes_product, r)
+    if u * primes_product + v * r != 1:
+        return None  # a prime of x_list is also the prime of a member
+    a = u - v * q
     if a < 0:
-        positive_a = -a
-        inverse_A0 = mul_inv(A0, n)
-        d = pow(inverse_A0, positive_a, n)
+        # A0^-|a| == (A0^|a|)^-1, so the exponentiation can still use A0's fixed-base table
+        d = mul_inv(__power(A0, -a, n, trapdoor), n)
     else:
-        d = pow(A0, a, n)
-    return d, b
+        d = __power(A0, a, n, trapdoor)
+    return d, v
 
 
-def verify_non_membership(A0, A_final, d, b, x, x_nonce, n):
-    prime = hash_to_prime(x, ACCUMULATED_PRIME_SIZE, x_nonce)[0]
+def batch_verify_non_membership(A0, A_final, d, b, x_list, x_nonces_list, n):
+    product = __calculate_primes_product(x_list, x_nonces_list)
+    if product is None:
+        return False
+    return __verify_non_membership(A0, A_final, d, b, product, n)
+
+
+# helper function, does not do hash_to_prime on x.
+def __verify_non_membership(A0, A_final, d, b, x, n):
     if b < 0:
         positive_b = -b
         inverse_A_final = mul_inv(A_final, n)
         second_power = pow(inverse_A_final, positive_b, n)
     else:
         second_power = pow(A_final, b, n)
-    return (pow(d, prime, n) * second_power) % n == A0
+    return (pow(d, x, n) * second_power) % n == A0
 
 
-def batch_prove_membership(A0, S, x_list, n):
-    product = 1
+def batch_prove_membership(A0, S, x_list, n, trapdoor=None):
+    x_set = set(x_list)
+    primes = []
     for element in S.keys():
-        if element not in x_list:
+        if element not in x_set:
             nonce = S[element]
-            product *= hash_to_prime(element, ACCUMULATED_PRIME_SIZE, nonce)[0]
-    A = pow(A0, product, n)
+            primes.append(element_prime(element, nonce))
+    A = __power(A0, calculate_product(primes), n, trapdoor)
     return A
 
 
-def batch_prove_membership_with_NIPoE(A0, S, x_list, n, w):
-    u = batch_prove_membership(A0, S, x_list, n)
-    nonces_list = []
-    for x in x_list:
-        nonces_list.append(S[x])
-    product = __calculate_primes_product(x_list, nonces_list)
-    (Q, l_nonce) = prove_exponentiation(u, product, w, n)
+def batch_prove_membership_with_NIPoE(A0, S, x_list, n, w, trapdoor=None):
+    u = batch_prove_membership(A0, S, x_list, n, trapdoor)
+    product = calculate_product([element_prime(x, S[x]) for x in x_list])
+    (Q, l_nonce) = prove_exponentiation(u, product, w, n, trapdoor)
     return Q, l_nonce, u
 
 
-def prove_membership_with_NIPoE(g, S, x, n, w):
-    u = prove_membership(g, S, x, n)
-    x_prime, x_nonce = hash_to_prime(x=x, nonce=S[x])
-    (Q, l_nonce) = prove_exponentiation(u, x_prime, w, n)
+def prove_membership_with_NIPoE(g, S, x, n, w, trapdoor=None):
+    u = prove_membership(g, S, x, n, trapdoor)
+    x_nonce = S[x]
+    x_prime = element_prime(x, x_nonce)
+    (Q, l_nonce) = prove_exponentiation(u, x_prime, w, n, trapdoor)
     return Q, l_nonce, u
 
 
@@ -111,13 +191,14 @@ def prove_membership_with_NIPoE(g, S, x, n, w):
 #   x - the (prime) element which was added to the accumulator
 #   w - the accumulator after the addition of x
 #   n - the modulu
+#   trapdoor - optional, the manager's factorization of n (see setup_manager)
 # Returns:
 #   Q, x - the NIPoE
 #   nonce - the nonce used for hash_to_prime to receive l (for saving work to the verifier)
-def prove_exponentiation(u, x, w, n):
+def prove_exponentiation(u, x, w, n, trapdoor=None):
     l, nonce = hash_to_prime(concat(x, u, w))  # Fiat-Shamir instead of interactive challenge
     q = x // l
-    Q = pow(u, q, n)
+    Q = __power(u, q, n, trapdoor)
     return Q, nonce
 
 
@@ -141,32 +222,68 @@ def __verify_exponentiation(Q, l_nonce, u, x, w, n):
     return (pow(Q, l, n) % n) * (pow(u, r, n) % n) % n == w
 
 
-def delete(A0, A, S, x, n):
+# With the trapdoor a delete is a single modular root of the current accumulator: A^(x^-1 mod lambda(n)).
+# Without it the accumulator is re-accumulated from A0 over the remaining elements.
+def delete(A0, A, S, x, n, trapdoor=None):
     if x not in S.keys():
         return A
+    elif trapdoor is not None:
+        prime = element_prime(x, S[x])
+        del S[x]
+        member_product.invalidate()
+        return trapdoor.root(A, prime)
     else:
         del S[x]
-        product = 1
+        member_product.invalidate()
+        primes = []
         for element in S.keys():
             nonce = S[element]
-            product *= hash_to_prime(element, ACCUMULATED_PRIME_SIZE, nonce)[0]
-        Anew = pow(A0, product, n)
+            primes.append(element_prime(element, nonce))
+        Anew = __power(A0, calculate_product(primes), n)
         return Anew
 
 
-def batch_delete(A0, S, x_list, n):
+# A_pre_delete - the current accumulator. Together with the trapdoor the whole batch is deleted with one
+# root by the product of the deleted primes, otherwise the remaining elements are re-accumulated from A0.
+def batch_delete(A0, S, x_list, n, trapdoor=None, A_pre_delete=None):
+    x_list = [x for x in dict.fromkeys(x_list) if x in S.keys()]
+    if trapdoor is not None and A_pre_delete is not None:
+        product = calculate_product([element_prime(x, S[x]) for x in x_list])
+        for x in x_list:
+            del S[x]
+        member_product.invalidate()
+        return trapdoor.root(A_pre_delete, product)
+
     for x in x_list:
         del S[x]
+    member_product.invalidate()
 
     if len(S) == 0:
         return A0
 
-    return batch_add(A0, S, x_list, n)
+    primes = [element_prime(x, S[x]) for x in S.keys()]
+    return __power(A0, calculate_product(primes), n, trapdoor)
 
 
 # agg_indexes: in case proofs_list actually relate to some aggregation of the inputs in x_list, it should contain pairs
 # of start index and end index.
-def batch_delete_using_membership_proofs(A_pre_delete, S, x_list, proofs_list, n, agg_indexes=[]):
+# Returns (A_post_delete, NI-PoE of A_post_delete^(product of the deleted primes) == A_pre_delete).
+def batch_delete_using_membership_proofs(A_pre_delete, S, x_list, proofs_list, n, agg_indexes=[], trapdoor=None,
+                                         workers=1):
+    result = batch_delete_using_membership_proofs_without_NIPoE(A_pre_delete, S, x_list, proofs_list, n, agg_indexes,
+                                                                trapdoor, workers)
+    if result is None:
+        return None
+    A_post_delete, product = result
+    return A_post_delete, prove_exponentiation(A_post_delete, product, A_pre_delete, n, trapdoor)
+
+
+# batch_delete_using_membership_proofs for callers that do not need the NI-PoE (it costs one more exponentiation
+# by the product of the deleted primes). Returns (A_post_delete, product of the deleted primes).
+# With the trapdoor the proofs are not combined, the new accumulator is one root by the product of the deleted primes.
+# Otherwise they are combined pairwise in a tree (witness_aggregation.py), workers - processes for its levels.
+def batch_delete_using_membership_proofs_without_NIPoE(A_pre_delete, S, x_list, proofs_list, n, agg_indexes=[],
+                                                       trapdoor=None, workers=1):
     is_aggregated = len(agg_indexes) > 0
     if is_aggregated and len(proofs_list) != len(agg_indexes):
         return None
@@ -179,24 +296,64 @@ def batch_delete_using_membership_proofs(A_pre_delete, S, x_list, proofs_list, n
         # sanity - verify each and every proof individually
         for i, indexes in enumerate(agg_indexes):
             current_x_list = x_list[indexes[0]: indexes[1]]
-            current_nonce_list = [S[x] for x in current_x_list]
-            product = __calculate_primes_product(current_x_list, current_nonce_list)
+            product = calculate_product([element_prime(x, S[x]) for x in current_x_list])
             members.append(product)
             for x in current_x_list:
                 del S[x]
     else:
         for x in x_list:
-            members.append(hash_to_prime(x, ACCUMULATED_PRIME_SIZE, S[x])[0])
+            members.append(element_prime(x, S[x]))
             del S[x]
+    member_product.invalidate()
 
-    A_post_delete = proofs_list[0]
-    product = members[0]
+    if trapdoor is not None:
+        product = calculate_product(members)
+        return trapdoor.root(A_pre_delete, product), product
 
-    for i in range(len(members))[1:]:
-        A_post_delete = shamir_trick(A_post_delete, proofs_list[i], product, members[i], n)
-        product *= members[i]
+    return aggregate_witnesses(proofs_list, members, n, workers)
 
-    return A_post_delete, prove_exponentiation(A_post_delete, product, A_pre_delete, n)
+
+# Trapdoor-less delete: the membership witness of x is the accumulator without x, so it is the new
+# accumulator. Returns None if the witness does not verify.
+def delete_using_membership_proof(A, S, x, proof, n):
+    if x not in S.keys():
+        return A
+    prime = element_prime(x, S[x])
+    if not __verify_membership(A, prime, proof, n):
+        return None
+    del S[x]
+    member_product.invalidate()
+    return proof
+
+
+# After deleting a single element with prime deleted_prime (A_post_delete^deleted_prime == A), returns the
+# witness of a remaining element (witness^prime == A) in the new accumulator.
+def update_membership_witness_on_delete(A_post_delete, witness, prime, deleted_prime, n):
+    return shamir_trick(witness, A_post_delete, prime, deleted_prime, n)
+
+
+# Batched version for all the remaining holders after deleting elements whose primes multiply to
+# deleted_product. For every remaining prime p, with a*deleted_product + b*p = 1, the new witness is
+# w^a * A_post_delete^b. Everything that depends only on the deleted set (the inverse of the new
+# accumulator, the product) is computed once; per holder only a 128-bit Bezout computation is done,
+# on deleted_product mod p instead of the full product.
+# witnesses is updated in place (and returned).
+def update_membership_witnesses_on_delete(A_post_delete, witnesses, primes, deleted_product, n):
+    inverse_A_post_delete = mul_inv(A_post_delete, n)
+    for i, prime in enumerate(primes):
+        reduced = deleted_product % prime
+        a, b = bezoute_coefficients(reduced, prime)
+        if a < 0:
+            a += prime
+            b -= reduced
+        # a*(D mod p) + b*p = 1  =>  a*D + (b - a*(D // p))*p = 1
+        b -= a * (deleted_product // prime)
+        if b < 0:
+            second_power = pow(inverse_A_post_delete, -b, n)
+        else:
+            second_power = pow(A_post_delete, b, n)
+        witnesses[i] = pow(witnesses[i], a, n) * second_power % n
+    return witnesses
 
 
 def verify_membership(A, x, nonce, proof, n):
@@ -222,42 +379,61 @@ def __verify_membership(A, x, proof, n):
     return pow(proof, x, n) == A
 
 
-def create_all_membership_witnesses(A0, S, n):
-    primes = [hash_to_prime(x=x, nonce=S[x])[0] for x in S.keys()]
-    return root_factor(A0, primes, n)
-
-
-def root_factor(g, primes, N):
-    n = len(primes)
-    if n == 1:
-        return [g]
-
-    n_tag = n // 2
-    primes_L = primes[n_tag:n]
-    product_L = calculate_product(primes_L)
-    g_L = pow(g, product_L, N)
-
-    primes_R = primes[0: n_tag]
-    product_R = calculate_product(primes_R)
-    g_R = pow(g, product_R, N)
-
-    L = root_factor(g_L, primes_R, N)
-    R = root_factor(g_R, primes_L, N)
-
-    return L + R
-
-
-def aggregate_membership_witnesses(A, witnesses_list, x_list, nonces_list, n):
+# tree - optional product tree (see product_tree.py) of the primes of S, in the order of S.keys().
+# When the caller already built it (e.g. while adding) it is reused instead of being rebuilt here.
+def create_all_membership_witnesses(A0, S, n, tree=None, trapdoor=None):
+    if tree is not None:
+        return root_factor(A0, tree[0], n, tree, trapdoor)
+    primes = [element_prime(x, S[x]) for x in S.keys()]
+    return root_factor(A0, primes, n, trapdoor=trapdoor)
+
+
+# create_all_membership_witnesses for sets whose witnesses do not fit in memory: sink(i, witness) is called
+# with the witness of the i-th element of S.keys() as soon as it is ready (see witness_stream.py).
+def stream_all_membership_witnesses(A0, S, n, sink, tree=None):
+    primes = tree[0] if tree is not None else [element_prime(x, S[x]) for x in S.keys()]
+    table = fixed_base_tables.get((A0, n))
+    stream_root_factor(A0, primes, n, sink, table.pow if table is not None else None, tree)
+
+
+# With the trapdoor every witness is a single exponentiation by an exponent reduced mod lambda(n),
+# so the product tree is not needed at all.
+def root_factor(g, primes, N, tree=None, trapdoor=None):
+    if trapdoor is not None:
+        return trapdoor.root_factor(g, primes)
+    if tree is None:
+        tree = product_tree(primes)
+    table = fixed_base_tables.get((g, N))
+    return tree_root_factor(g, tree, N, table.pow if table is not None else None)
+
+
+# The prime of an accumulated element, from the prime cache when it is there. For the provers only,
+# the verification functions always do hash_to_prime themselves.
+def element_prime(x, nonce):
+    prime = prime_cache.get(x, nonce)
+    if prime is None:
+        prime = hash_to_prime(x, ACCUMULATED_PRIME_SIZE, nonce)[0]
+        prime_cache.put(x, prime, nonce)
+    return prime
+
+
+# pow(base, exponent, n), split into two CRT exponentiations when the trapdoor is known, and through the
+# fixed-base table of base when there is one.
+def __power(base, exponent, n, trapdoor=None):
+    if trapdoor is not None:
+        return trapdoor.pow(base, exponent)
+    table = fixed_base_tables.get((base, n))
+    if table is not None and exponent >= 0:
+        return table.pow(exponent)
+    return pow(base, exponent, n)
+
+
+# The witnesses are combined pairwise in a tree (witness_aggregation.py), workers - processes for its levels
+def aggregate_membership_witnesses(A, witnesses_list, x_list, nonces_list, n, workers=1):
     primes = []
     for i in range(len(x_list)):
-        prime = hash_to_prime(x_list[i], ACCUMULATED_PRIME_SIZE, nonces_list[i])[0]
+        prime = element_prime(x_list[i], nonces_list[i])
         primes.append(prime)
 
-    agg_wit = witnesses_list[0]
-    product = primes[0]
-
-    for i in range(len(x_list))[1:]:
-        agg_wit = shamir_trick(agg_wit, witnesses_list[i], product, primes[i], n)
-        product *= primes[i]
-
+    agg_wit, product = aggregate_witnesses(witnesses_list, primes, n, workers)
     return agg_wit, prove_exponentiation(agg_wit, product, A, n)
\ No newline at end of file
@@ -0,0 +1,144 @@
+# Asynchronous ingestion: the same data as data.py, fetched with raw JSON-RPC over one pooled aiohttp session.
+#
+# data.py waits for one get_block and then one get_transaction_receipt per transaction, so ingest time is the
+# round-trip latency times the number of transactions. Here up to block_concurrency blocks are fetched at
+# once, and their receipts go out as JSON-RPC batch calls of receipt_batch_size requests, with at most
+# concurrency calls in flight on the pooled connections. Failed calls (network errors, HTTP 429/5xx, JSON-RPC
+# errors such as rate limits) are retried with exponential backoff.
+#
+# Blocks are returned in order. fixture_rpc_server.py serves transactions.json as a local stand-in node.
+import asyncio
+import itertools
+import random
+
+import aiohttp
+
+DEFAULT_CONCURRENCY = 16  # JSON-RPC calls in flight, also the size of the connection pool
+BLOCK_CONCURRENCY = 8  # blocks fetched at the same time
+RECEIPT_BATCH_SIZE = 50  # receipts per JSON-RPC batch call
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+REQUEST_TIMEOUT = 30
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RPCError(Exception):
+    pass
+
+
+class AsyncRPCClient:
+    def __init__(self, url, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE):
+        self.url = url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__ids = itertools.count(1)
+        self.__session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency),
+                                               timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        await self.__session.close()
+
+    async def call(self, method, params):
+        return (await self.batch_call([(method, params)]))[0]
+
+    # Sends [(method, params)] as one JSON-RPC batch, returns the results in the same order.
+    # Only the calls that failed are sent again on a retry.
+    async def batch_call(self, calls):
+        if len(calls) == 0:
+            return []
+        requests = [{'jsonrpc': '2.0', 'id': next(self.__ids), 'method': method, 'params': params}
+                    for method, params in calls]
+        results = {}
+        pending = requests
+        for attempt in range(self.max_retries + 1):
+            try:
+                errors = await self.__post(pending, results)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RPCError) as e:
+                errors = [e]
+            pending = [request for request in pending if request['id'] not in results]
+            if len(pending) == 0:
+                return [results[request['id']] for request in requests]
+            if attempt == self.max_retries:
+                raise errors[0] if isinstance(errors[0], Exception) else RPCError(errors[0])
+            await asyncio.sleep(self.backoff_base * 2 ** attempt * (1 + random.random()))
+
+    # Posts the requests, stores the successful results by id and returns the errors of the others.
+    async def __post(self, requests, results):
+        async with self.__semaphore:
+            async with self.__session.post(self.url, json=requests) as response:
+                if response.status in RETRY_STATUSES:
+                    raise RPCError(f"HTTP {response.status}")
+                response.raise_for_status()
+                replies = await response.json(content_type=None)
+        if isinstance(replies, dict):  # some nodes answer a failed batch with a single error object
+            raise RPCError(replies.get('error'))
+        replies = {reply.get('id'): reply for reply in replies}
+        errors = []
+        for request in requests:
+            reply = replies.get(request['id'])
+            if reply is None:
+                errors.append("missing reply")
+            elif 'error' in reply:
+                errors.append(reply['error'])
+            else:
+                results[request['id']] = reply['result']
+        return errors
+
+
+# Returns (hashes, receipts) of one block, the receipts in the order of the hashes.
+async def fetch_block_data_async(client, block_number, receipt_batch_size=RECEIPT_BATCH_SIZE):
+    block = await client.call('eth_getBlockByNumber', [hex(block_number), False])
+    if block is None:
+        raise RPCError(f"block {block_number} not found")
+    hashes = block['transactions']
+    chunks = [hashes[i:i + receipt_batch_size] for i in range(0, len(hashes), receipt_batch_size)]
+    results = await asyncio.gather(*(client.batch_call([('eth_getTransactionReceipt', [tx_hash])
+                                                         for tx_hash in chunk]) for chunk in chunks))
+    receipts = [receipt for result in results for receipt in result]
+    return hashes, receipts
+
+
+# Async generator of (block_number, hashes, receipts) for start_block <= block_number < end_block, in order.
+# At most block_concurrency blocks are in flight, so a slow consumer does not let fetched blocks pile up.
+async def iter_blocks_async(url, start_block, end_block, concurrency=DEFAULT_CONCURRENCY,
+                            block_concurrency=BLOCK_CONCURRENCY, receipt_batch_size=RECEIPT_BATCH_SIZE):
+    async with AsyncRPCClient(url, concurrency) as client:
+        pending = []
+        block_numbers = iter(range(start_block, end_block))
+        try:
+            for block_number in itertools.islice(block_numbers, block_concurrency):
+                pending.append((block_number, asyncio.ensure_future(
+                    fetch_block_data_async(client, block_number, receipt_batch_size))))
+            while len(pending) != 0:
+                block_number, task = pending.pop(0)
+                hashes, receipts = await task
+                for next_block in itertools.islice(block_numbers, 1):
+                    pending.append((next_block, asyncio.ensure_future(
+                        fetch_block_data_async(client, next_block, receipt_batch_size))))
+                yield block_number, hashes, receipts
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+# Fetches the whole range, returns (transaction hashes, receipts, tx hash -> receipt) like data.main().
+async def fetch_blocks_async(url, start_block, end_block, **kwargs):
+    all_transaction_hashes = []
+    all_transaction_receipts = []
+    map_transactions = {}
+    async for _, hashes, receipts in iter_blocks_async(url, start_block, end_block, **kwargs):
+        all_transaction_hashes.extend(hashes)
+        all_transaction_receipts.extend(receipts)
+        map_transactions.update(zip(hashes, receipts))
+    return all_transaction_hashes, all_transaction_receipts, map_transactions
+
+
+def main_async(url, start_block, end_block, **kwargs):
+    return asyncio.run(fetch_blocks_async(url, start_block, end_block, **kwargs))
@@ -1,77 +1,32 @@
 import secrets
 import hashlib
 
+from keygen import generate_two_large_distinct_primes
+from primality import is_prime
+from product_tree import calculate_product
+
 def concat(*args):
     return ''.join([str(arg) for arg in args])
 
-def generate_two_large_distinct_primes(bits):
-    p = secrets.randbits(bits)
-    q = secrets.randbits(bits)
-    while p == q:
-        q = secrets.randbits(bits)
-    return p, q
-
-def calculate_product(primes):
-    product = 1
-    for prime in primes:
-        product *= prime
-    return product
-
-def bezoute_coefficients(a, b):
-    s, old_s = 0, 1
-    t, old_t = 1, 0
-    r, old_r = b, a
-
-    while r != 0:
-        quotient = old_r // r
-        old_r, r = r, old_r - quotient * r
-        old_s, s = s, old_s - quotient * s
-        old_t, t = t, old_t - quotient * t
-
-    return old_s, old_t
-
+# Only the inverse is needed here: the built-in raises ValueError when there is none, like the loop did.
 def mul_inv(a, n):
-    t, new_t = 0, 1
-    r, new_r = n, a
-
-    while new_r != 0:
-        quotient = r // new_r
-        t, new_t = new_t, t - quotient * new_t
-        r, new_r = new_r, r - quotient * new_r
-
-    if r > 1:
-        raise ValueError("No inverse exists")
-    if t < 0:
-        t += n
-
-    return t
+    return pow(a, -1, n)
 
 def shamir_trick(g1, g2, a1, a2, n):
     return (pow(g1, a2, n) * pow(g2, a1, n)) % n
 
-def is_prime(n):
-    if n <= 1:
-        return False
-    if n <= 3:
-        return True
-    if n % 2 == 0 or n % 3 == 0:
-        return False
-    i = 5
-    while i * i <= n:
-        if n % i == 0 or n % (i + 2) == 0:
-            return False
-        i += 6
-    return True
-
 def hash_to_prime(x, nonce=None):
-    if nonce is None:
-        nonce = secrets.token_bytes(16)
+    fixed_nonce = nonce is not None
     while True:
+        if not fixed_nonce:
+            nonce = secrets.token_bytes(16)  # a fresh nonce for every candidate
         hash_input = (x + nonce.hex()).encode()
         candidate = hashlib.sha256(hash_input).hexdigest()
         prime_candidate = int(candidate, 16) | 1  # Ensure odd number
         if is_prime(prime_candidate):
             return prime_candidate, nonce
+        if fixed_nonce:
+            raise ValueError("nonce does not hash to a prime")
 
 RSA_KEY_SIZE = 3072  # RSA key size 
 RSA_PRIME_SIZE = RSA_KEY_SIZE // 2
@@ -91,22 +46,23 @@ def add(A, S, x, n):
     return A
 
 def batch_add(A_pre_add, S, x_list, n):
-    product = 1
+    primes = []
     for x in x_list:
         if x not in S:
             hash_prime, nonce = hash_to_prime(x)
             S[x] = nonce
-            product *= hash_prime
-    A_post_add = pow(A_pre_add, product, n)
+            primes.append(hash_prime)
+    A_post_add = pow(A_pre_add, calculate_product(primes), n)
     return A_post_add
 
 def batch_prove_membership(A0, S, x_list, n):
-    product = 1
+    x_set = set(x_list)
+    primes = []
     for element in S:
-        if element not in x_list:
+        if element not in x_set:
             nonce = S[element]
-            product *= hash_to_prime(element, nonce)[0]
-    return pow(A0, product, n)
+            primes.append(hash_to_prime(element, nonce)[0])
+    return pow(A0, calculate_product(primes), n)
 
 def delete_transactions(A0, S, transactions_to_delete, n):
     for x in transactions_to_delete:
@@ -137,23 +93,24 @@ def verify_batch_witnesses(n, batch_witnesses, S):
         assert pow(A0, product, n) == A, "Verification failed!"
         A0 = A  # Update accumulator for next batch verification
 
-# Step 1: Generate 100 random transaction hashes
-transaction_hashes = generate_random_transaction_hashes(100)
+if __name__ == '__main__':
+    # Step 1: Generate 100 random transaction hashes
+    transaction_hashes = generate_random_transaction_hashes(100)
 
-# Step 2: Accumulate in 10 batches of 10 transactions each and generate witnesses
-n, batch_witnesses, A0, S = accumulate_in_batches(transaction_hashes, batch_size=10)
+    # Step 2: Accumulate in 10 batches of 10 transactions each and generate witnesses
+    n, batch_witnesses, A0, S = accumulate_in_batches(transaction_hashes, batch_size=10)
 
-# Step 3: Verify all batch witnesses
-verify_batch_witnesses(n, batch_witnesses, S)
+    # Step 3: Verify all batch witnesses
+    verify_batch_witnesses(n, batch_witnesses, S)
 
-# Step 4: Delete a batch of transactions (e.g., the first batch)
-A0_after_deletion = delete_transactions(A0, S, batch_witnesses[0][1], n)
+    # Step 4: Delete a batch of transactions (e.g., the first batch)
+    A0_after_deletion = delete_transactions(A0, S, batch_witnesses[0][1], n)
 
-# Verify that the deleted batch is no longer in the accumulator
-try:
-    verify_batch_witnesses(n, batch_witnesses[1:], S)  # Verify only remaining batches
-    print("Verification succeeded after deletion")
-except AssertionError:
-    print("Verification failed after deletion (as expected)")
+    # Verify that the deleted batch is no longer in the accumulator
+    try:
+        verify_batch_witnesses(n, batch_witnesses[1:], S)  # Verify only remaining batches
+        print("Verification succeeded after deletion")
+    except AssertionError:
+        print("Verification failed after deletion (as expected)")
 
-print("Accumulator and witness generation, verification, and deletion completed.")
+    print("Accumulator and witness generation, verification, and deletion completed.")
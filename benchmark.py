@@ -1,4 +1,8 @@
-import secrets, hashlib, random, time
+import secrets, time
+
+from keystore import load_or_create_keystore
+from prime_sieve import hash_to_prime, batch_hash_to_prime
+from product_tree import calculate_product, product_tree, tree_root_factor
 
 RSA_KEY_SIZE = 3072  
 RSA_PRIME_SIZE = int(RSA_KEY_SIZE / 2)
@@ -6,9 +10,7 @@ ACCUMULATED_PRIME_SIZE = 128
 
 
 def setup():
-    p, q = generate_two_large_distinct_primes(RSA_PRIME_SIZE)
-    n = p * q
-    A0 = secrets.randbelow(n)
+    n, A0, _ = load_or_create_keystore(RSA_PRIME_SIZE)  # the modulus is only generated on the first run
     return n, A0, {}
 
 
@@ -23,60 +25,15 @@ def add(A, S, x, n):
 
 
 def batch_add(A_pre_add, S, x_list, n):
-    product = 1
     Map = {}
-    for x in x_list:
-        if x not in S:
-            hash_prime, nonce = hash_to_prime(x, ACCUMULATED_PRIME_SIZE)
-            S[x] = nonce
-            Map[x] = hash_prime
-            product *= hash_prime
-    A_post_add = pow(A_pre_add, product, n)
+    new_x_list = [x for x in dict.fromkeys(x_list) if x not in S]
+    for x, (hash_prime, nonce) in zip(new_x_list, batch_hash_to_prime(new_x_list, ACCUMULATED_PRIME_SIZE)):
+        S[x] = nonce
+        Map[x] = hash_prime
+    A_post_add = pow(A_pre_add, calculate_product(Map.values()), n)
     return A_post_add, Map
 
 
-def generate_large_prime(num_of_bits):
-    while True:
-        num = secrets.randbelow(pow(2, num_of_bits))
-        if is_prime(num):
-            return num
-
-
-def generate_two_large_distinct_primes(num_of_bits):
-    p = generate_large_prime(num_of_bits)
-    while True:
-        q = generate_large_prime(num_of_bits)
-        if q != p:
-            return p, q
-
-
-def is_prime(num):
-    if num < 2:
-        return False
-    if num % 2 == 0 and num > 2:
-        return False
-    for _ in range(10):  # Miller-Rabin test
-        a = random.randint(2, num - 1)
-        if pow(a, num - 1, num) != 1:
-            return False
-    return True
-
-
-def hash_to_prime(x, num_of_bits=128, nonce=0):
-    num = hash_to_128_bits(x)
-    while True:
-        num += nonce
-        if is_prime(num):
-            return num, nonce
-        nonce += 1
-
-
-def hash_to_128_bits(hex_string):
-    hex_bytes = bytes.fromhex(hex_string)
-    hash_result = hashlib.sha256(hex_bytes).digest()
-    return int.from_bytes(hash_result[:16], byteorder='big')
-
-
 def verify_membership(A, x, nonce, proof, n):
     hash_value = hash_to_prime(x, ACCUMULATED_PRIME_SIZE, nonce)[0]
     return pow(proof, hash_value, n) == A, hash_value
@@ -89,65 +46,43 @@ def create_all_membership_witnesses(A0, S, n):
 
 
 def root_factor(g, primes, N):
-    n = len(primes)
-    if n == 1:
-        return [g]
-
-    n_half = n // 2
-    primes_L = primes[n_half:n]
-    product_L = calculate_product(primes_L)
-    g_L = pow(g, product_L, N)
-
-    primes_R = primes[0:n_half]
-    product_R = calculate_product(primes_R)
-    g_R = pow(g, product_R, N)
-
-    L = root_factor(g_L, primes_R, N)
-    R = root_factor(g_R, primes_L, N)
+    return tree_root_factor(g, product_tree(primes), N)
 
-    return L + R
 
+if __name__ == '__main__':
+    # **Setup RSA accumulator**
+    start_setup = time.time()
+    n, A0, S = setup()
+    end_setup = time.time()
 
-def calculate_product(lst):
-    r = 1
-    for x in lst:
-        r *= x
-    return r
+    # **Print RSA Parameters**
+    print(f"\n=== RSA ACCUMULATOR SETUP ===")
+    print(f"n (Modulus): {n}")
+    print(f"A0 (Initial Accumulator): {A0}")
+    print(f"Setup Time: {end_setup - start_setup:.5f} seconds\n")
 
+    # **Batch Addition**
+    x_values = [secrets.token_hex(32) for _ in range(10)]
 
-# **Setup RSA accumulator**
-start_setup = time.time()
-n, A0, S = setup()
-end_setup = time.time()
+    start_add = time.time()
+    A1, _ = batch_add(A0, S, x_values, n)
+    end_add = time.time()
 
-# **Print RSA Parameters**
-print(f"\n=== RSA ACCUMULATOR SETUP ===")
-print(f"n (Modulus): {n}")
-print(f"A0 (Initial Accumulator): {A0}")
-print(f"Setup Time: {end_setup - start_setup:.5f} seconds\n")
+    print(f"Batch addition time: {end_add - start_add:.5f} seconds")
+    print(f"Updated Accumulator (A1): {A1}\n")
 
-# **Batch Addition**
-x_values = [secrets.token_hex(32) for _ in range(10)]
+    # **Generate Membership Witnesses**
+    membership_witnesses = create_all_membership_witnesses(A0, S, n)
 
-start_add = time.time()
-A1, _ = batch_add(A0, S, x_values, n)
-end_add = time.time()
+    # **Verify Membership for Each Element**
+    print("=== MEMBERSHIP VERIFICATION ===")
+    for i, x in enumerate(x_values):
+        proof = membership_witnesses.get(x)
 
-print(f"Batch addition time: {end_add - start_add:.5f} seconds")
-print(f"Updated Accumulator (A1): {A1}\n")
-
-# **Generate Membership Witnesses**
-membership_witnesses = create_all_membership_witnesses(A0, S, n)
-
-# **Verify Membership for Each Element**
-print("=== MEMBERSHIP VERIFICATION ===")
-for i, x in enumerate(x_values):
-    proof = membership_witnesses.get(x)
-
-    if proof is not None:
-        result, hashed_x = verify_membership(A1, x, 0, proof, n)
-        print(f"Element {i}: Verification = {result}, Hashed Value = {hashed_x}, Witness = {proof}")
-    else:
-        print(f"Element {i}: Witness not found, verification failed.")
+        if proof is not None:
+            result, hashed_x = verify_membership(A1, x, 0, proof, n)
+            print(f"Element {i}: Verification = {result}, Hashed Value = {hashed_x}, Witness = {proof}")
+        else:
+            print(f"Element {i}: Witness not found, verification failed.")
 
-print("\nExecution complete.")
+    print("\nExecution complete.")
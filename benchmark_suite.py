@@ -0,0 +1,307 @@
+# Reproducible scaling benchmarks of the accumulator operations.
+#
+# Everything is derived from a seed: the modulus (p, q from a deterministic prime search, kept in
+# BENCHMARK_FIXTURE_PATH so that it is only searched once), A0 and the elements. Every (benchmark, size) case
+# runs in a fresh process, so its peak RSS is its own, and is timed repeat times with perf_counter; the
+# median goes into the results. Every case times a public entry point (allFunctions, WitnessStore, batch_verify,
+# checkpoint_chain...) on the fixture state. Setup (hashing the elements, making witnesses with the trapdoor...)
+# is not timed.
+#
+#   python benchmark_suite.py run [--sizes 10 100 ...] [--max-size N] [--repeat 5] [--output results.json]
+#   python benchmark_suite.py compare old.json new.json [--threshold 0.1]
+# compare lists the cases whose median got slower by more than the threshold and exits with 1 if there is any.
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count, get_context
+
+import allFunctions
+from allFunctions import prime_cache, root_factor
+from batch_verify import batch_verify_membership_witnesses
+from checkpoint_chain import Transition, prove_transition, verify_transition
+from helpfunctions import hash_to_prime
+from primality import is_prime
+from prime_sieve import batch_hash_to_prime
+from product_tree import calculate_product, product_tree
+from trapdoor import Trapdoor
+from witness_store import WitnessStore
+
+BENCHMARK_FIXTURE_PATH = 'benchmark_fixture.json'
+RESULTS_PATH = 'benchmark_results.json'
+DEFAULT_SEED = 2024
+DEFAULT_BITS = 3072
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+ACCUMULATED_PRIME_SIZE = 128
+SIZES = [10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6]
+STORE_BATCH_SIZE = 10  # elements added or deleted by the WitnessStore cases, like an ingest batch of checkpoint.py
+
+
+# Deterministic fixture of the modulus size: {'p', 'q', 'A0'}, generated from the seed and cached in path.
+def load_fixture(bits=DEFAULT_BITS, seed=DEFAULT_SEED, path=BENCHMARK_FIXTURE_PATH):
+    key = f"{bits}:{seed}"
+    fixtures = dict()
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            fixtures = json.load(f)
+    if key not in fixtures:
+        rng = random.Random(seed)
+        p = __fixture_prime(rng, bits // 2)
+        q = __fixture_prime(rng, bits // 2)
+        while q == p:
+            q = __fixture_prime(rng, bits // 2)
+        fixtures[key] = {'p': hex(p), 'q': hex(q), 'A0': hex(rng.randrange(2, p * q))}
+        with open(path, 'w') as f:
+            json.dump(fixtures, f, indent=2)
+    fixture = fixtures[key]
+    return {name: int(value, 16) for name, value in fixture.items()}
+
+
+# size elements (64 hex digits, like transaction hashes) from the seed
+def fixture_elements(size, seed=DEFAULT_SEED):
+    rng = random.Random(seed + size)
+    return [f"{rng.getrandbits(256):064x}" for _ in range(size)]
+
+
+def __fixture_prime(rng, bits):
+    candidate = rng.getrandbits(bits) | (1 << (bits - 1)) | (1 << (bits - 2)) | 1
+    while not is_prime(candidate):
+        candidate += 2
+    return candidate
+
+
+# Every benchmark is (setup, prepare, run, default maximum size): setup(fixture, elements) returns the state of the
+# case, prepare(state) the argument of one run (a fresh copy of what the run changes, None to pass the state as it
+# is) and run(argument) calls the public entry point that is benchmarked. Only run is timed. The maximum sizes keep
+# a default sweep within hours on one core.
+def __setup_elements(fixture, elements):
+    return elements
+
+
+def __run_hash_to_prime(elements):
+    batch_hash_to_prime(elements, ACCUMULATED_PRIME_SIZE)
+
+
+def __setup_primes(fixture, elements):
+    primes = [prime for prime, _ in batch_hash_to_prime(elements, ACCUMULATED_PRIME_SIZE)]
+    return fixture, primes
+
+
+def __run_root_factor(state):
+    fixture, primes = state
+    root_factor(fixture['A0'], primes, fixture['p'] * fixture['q'])
+
+
+# fixture, n, the elements, S and their primes (hashed like allFunctions does, and kept in its prime cache),
+# the trapdoor, the accumulator of the elements and their witnesses (made with the trapdoor: one exponentiation
+# each instead of root_factor)
+def __setup_accumulated(fixture, elements):
+    trapdoor = Trapdoor(fixture['p'], fixture['q'])
+    S, primes = dict(), dict()
+    for x in elements:
+        primes[x], S[x] = hash_to_prime(x, ACCUMULATED_PRIME_SIZE)
+        prime_cache.put(x, primes[x], S[x])
+    A = trapdoor.pow(fixture['A0'], calculate_product(primes.values()))
+    witnesses = dict(zip(elements, trapdoor.root_factor(fixture['A0'], list(primes.values()))))
+    return {'fixture': fixture, 'n': trapdoor.n, 'elements': elements, 'S': S, 'primes': primes,
+            'trapdoor': trapdoor, 'A': A, 'witnesses': witnesses}
+
+
+def __prepare_S(state):
+    return dict(state, S=dict(state['S']))
+
+
+def __run_batch_add(state):
+    allFunctions.batch_add(state['fixture']['A0'], dict(), state['elements'], state['n'])
+
+
+def __run_verify_single(state):
+    for x in state['elements']:
+        if not allFunctions.verify_membership(state['A'], x, state['S'][x], state['witnesses'][x], state['n']):
+            raise ValueError("witness does not verify")
+
+
+def __run_verify_batch(state):
+    elements = state['elements']
+    if len(batch_verify_membership_witnesses(state['A'], elements, [state['S'][x] for x in elements],
+                                             [state['witnesses'][x] for x in elements], state['n'])) != 0:
+        raise ValueError("witness does not verify")
+
+
+# one checkpoint transition of size elements: the manager's proof and the light client's check
+def __setup_nipoe(fixture, elements):
+    n = fixture['p'] * fixture['q']
+    hashed = [hash_to_prime(x, ACCUMULATED_PRIME_SIZE) for x in elements]
+    primes = [prime for prime, _ in hashed]
+    A = Trapdoor(fixture['p'], fixture['q']).pow(fixture['A0'], calculate_product(primes))
+    return fixture['A0'], A, elements, [nonce for _, nonce in hashed], primes, n
+
+
+def __run_nipoe(state):
+    A0, A, elements, nonces, primes, n = state
+    Q, l_nonce = prove_transition(A0, primes, A, n)
+    if not verify_transition(Transition(0, A0, A, Q, l_nonce, elements, nonces), n):
+        raise ValueError("NI-PoE does not verify")
+
+
+# allFunctions.delete of one element, re-accumulated from A0 without the trapdoor, one root with it
+def __run_delete(state):
+    allFunctions.delete(state['fixture']['A0'], state['A'], state['S'], state['elements'][0], state['n'])
+
+
+def __run_delete_trapdoor(state):
+    allFunctions.delete(state['fixture']['A0'], state['A'], state['S'], state['elements'][0], state['n'],
+                        state['trapdoor'])
+
+
+# allFunctions.batch_delete of half the set
+def __run_batch_delete(state):
+    elements = state['elements']
+    allFunctions.batch_delete(state['fixture']['A0'], state['S'], elements[:len(elements) // 2], state['n'])
+
+
+def __run_batch_delete_trapdoor(state):
+    elements = state['elements']
+    allFunctions.batch_delete(state['fixture']['A0'], state['S'], elements[:len(elements) // 2], state['n'],
+                              state['trapdoor'], state['A'])
+
+
+# WitnessStore over the accumulated elements, without the trapdoor: batch_add of STORE_BATCH_SIZE new elements
+# (every witness is raised) and batch_delete of STORE_BATCH_SIZE of the elements (every witness is updated with
+# Bezout coefficients), as an ingest or a delete of a running manager
+def __setup_store(fixture, elements):
+    state = __setup_accumulated(fixture, elements)
+    rng = random.Random(len(elements))
+    state['batch'] = [f"{rng.getrandbits(256):064x}" for _ in range(STORE_BATCH_SIZE)]
+    state['tree'] = product_tree(state['primes'].values())
+    return state
+
+
+def __prepare_store(state):
+    S = dict(state['S'])
+    return state, WitnessStore.restore(state['fixture']['A0'], state['A'], S, state['primes'], state['witnesses'],
+                                       [list(level) for level in state['tree']], state['n'])
+
+
+def __run_store_batch_add(argument):
+    state, store = argument
+    store.batch_add(state['batch'])
+
+
+def __run_store_batch_delete(argument):
+    state, store = argument
+    store.batch_delete(state['elements'][:min(STORE_BATCH_SIZE, len(state['elements']) // 2)])
+
+
+BENCHMARKS = {
+    'hash_to_prime': (__setup_elements, None, __run_hash_to_prime, 10 ** 6),
+    'batch_add': (__setup_accumulated, None, __run_batch_add, 10 ** 4),
+    'root_factor': (__setup_primes, None, __run_root_factor, 10 ** 4),
+    'verify_single': (__setup_accumulated, None, __run_verify_single, 10 ** 4),
+    'verify_batch': (__setup_accumulated, None, __run_verify_batch, 10 ** 4),
+    'nipoe': (__setup_nipoe, None, __run_nipoe, 10 ** 4),
+    'delete': (__setup_accumulated, __prepare_S, __run_delete, 10 ** 5),
+    'delete_trapdoor': (__setup_accumulated, __prepare_S, __run_delete_trapdoor, 10 ** 6),
+    'batch_delete': (__setup_accumulated, __prepare_S, __run_batch_delete, 10 ** 5),
+    'batch_delete_trapdoor': (__setup_accumulated, __prepare_S, __run_batch_delete_trapdoor, 10 ** 6),
+    'store_batch_add': (__setup_store, __prepare_store, __run_store_batch_add, 10 ** 4),
+    'store_batch_delete': (__setup_store, __prepare_store, __run_store_batch_delete, 10 ** 4),
+}
+
+
+# Runs one case in this process: {'benchmark', 'size', 'median', 'min', 'runs', 'peak_rss_kb'}
+def run_case(name, size, bits=DEFAULT_BITS, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT):
+    # the Fiat-Shamir challenges hash the decimal string of the whole product, above CPython's default limit
+    if hasattr(sys, 'set_int_max_str_digits'):
+        sys.set_int_max_str_digits(0)
+    setup, prepare, run, _ = BENCHMARKS[name]
+    state = setup(load_fixture(bits, seed), fixture_elements(size, seed))
+    runs = []
+    for _ in range(repeat):
+        argument = prepare(state) if prepare is not None else state
+        start = time.perf_counter()
+        run(argument)
+        runs.append(time.perf_counter() - start)
+    return {'benchmark': name, 'size': size, 'median': statistics.median(runs), 'min': min(runs), 'runs': runs,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+# Runs every benchmark over the sizes (up to its maximum size, or max_size when given), each case in a new
+# process. Returns the results document that is written as JSON.
+def run_suite(names=None, sizes=SIZES, max_size=None, bits=DEFAULT_BITS, seed=DEFAULT_SEED, repeat=DEFAULT_REPEAT):
+    load_fixture(bits, seed)  # searched once here, not in every case
+    results = []
+    for name in names if names is not None else BENCHMARKS.keys():
+        limit = max_size if max_size is not None else BENCHMARKS[name][3]
+        for size in sizes:
+            if size > limit:
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_case, name, size, bits, seed, repeat).result()
+            print(f"{name:>21} {size:>8} {result['median']:>12.6f}s {result['peak_rss_kb']:>10} KB", flush=True)
+            results.append(result)
+    return {'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                     'processor': platform.processor(), 'cpu_count': cpu_count(), 'bits': bits, 'seed': seed,
+                     'repeat': repeat, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+# [(benchmark, size, old median, new median, ratio)] of the cases in both documents that got slower by more
+# than threshold (0.1 = 10%)
+def compare_results(old, new, threshold=DEFAULT_THRESHOLD):
+    old_medians = {(result['benchmark'], result['size']): result['median'] for result in old['results']}
+    regressions = []
+    for result in new['results']:
+        key = (result['benchmark'], result['size'])
+        if key in old_medians and result['median'] > old_medians[key] * (1 + threshold):
+            regressions.append((key[0], key[1], old_medians[key], result['median'],
+                                result['median'] / old_medians[key]))
+    return regressions
+
+
+def __main(arguments):
+    parser = argparse.ArgumentParser(description="accumulator scaling benchmarks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS.keys()))
+    run_parser.add_argument('--sizes', nargs='+', type=int, default=SIZES)
+    run_parser.add_argument('--max-size', type=int)
+    run_parser.add_argument('--bits', type=int, default=DEFAULT_BITS)
+    run_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    run_parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run_parser.add_argument('--output', default=RESULTS_PATH)
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(arguments)
+
+    if args.command == 'run':
+        document = run_suite(args.benchmarks, args.sizes, args.max_size, args.bits, args.seed, args.repeat)
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        return 0
+
+    with open(args.old, 'r') as f:
+        old = json.load(f)
+    with open(args.new, 'r') as f:
+        new = json.load(f)
+    if old['meta']['bits'] != new['meta']['bits'] or old['meta']['seed'] != new['meta']['seed']:
+        print("warning: the results are for different fixtures")
+    regressions = compare_results(old, new, args.threshold)
+    for name, size, old_median, new_median, ratio in regressions:
+        print(f"REGRESSION {name} size {size}: {old_median:.6f}s -> {new_median:.6f}s ({ratio:.2f}x)")
+    if len(regressions) == 0:
+        print("no regressions")
+    return 1 if len(regressions) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(__main(sys.argv[1:]))
@@ -1,37 +1,11 @@
 from data import main
-from final import setup, batch_add, create_all_membership_witnesses, verify_membership
+from allFunctions import prime_cache, setup_from_keystore, verify_membership
+from checkpoint_chain import CheckpointChain, prove_transition
+from checkpoint_log import SNAPSHOT_TREE_LEVEL, CheckpointManager
+from product_tree import restore_product_tree
+from state_file import write_state
+from witness_store import WitnessStore
 import secrets
-import json
-import os
-
-class CheckpointManager:
-    def __init__(self, checkpoint_interval=10, checkpoint_dir='checkpoints'):
-        self.checkpoint_interval = checkpoint_interval
-        self.checkpoint_dir = checkpoint_dir
-        self.batch_counter = 0
-
-        if not os.path.exists(self.checkpoint_dir):
-            os.makedirs(self.checkpoint_dir)
-
-    def save_checkpoint(self, batch_num, A, transactions):
-        checkpoint_path = os.path.join(self.checkpoint_dir, f'checkpoint_{batch_num}.json')
-        checkpoint_data = {
-            'batch_num': batch_num,
-            'A': A,
-            'transactions': transactions
-        }
-        with open(checkpoint_path, 'w') as f:
-            json.dump(checkpoint_data, f, indent=4, default=str)
-
-    def load_checkpoint(self, batch_num):
-        checkpoint_path = os.path.join(self.checkpoint_dir, f'checkpoint_{batch_num}.json')
-        with open(checkpoint_path, 'r') as f:
-            checkpoint_data = json.load(f)
-        return checkpoint_data['A'], checkpoint_data['transactions']
-
-    def should_save_checkpoint(self):
-        self.batch_counter += 1
-        return self.batch_counter % self.checkpoint_interval == 0
 
 def ensure_even_length_hex(hex_str):
     if hex_str.startswith("0x"):
@@ -40,49 +14,71 @@ def ensure_even_length_hex(hex_str):
         hex_str = '0' + hex_str
     return '0x' + hex_str
 
-def reconstruct_witnesses(A, transactions, n):
-    _, S, _ = setup()  # Reinitialize S
-    A_reconstructed, _ = batch_add(A0, S, transactions, n)
-    if A_reconstructed != A:
+# Rebuilds the witness store from a recovered checkpoint. The snapshot holds the witnesses and the upper
+# levels of the product tree, so only the batches logged after it are added again (with their logged primes).
+# A snapshot saved without the witnesses falls back to computing them from A0.
+def reconstruct_witnesses(checkpoint, n):
+    if checkpoint.snapshot_A is None:
+        store = WitnessStore(A0, dict(), n)
+    elif checkpoint.witnesses is not None and checkpoint.tree_levels is not None:
+        tree = restore_product_tree((checkpoint.primes[x] for x in checkpoint.S.keys()), checkpoint.tree_levels,
+                                    SNAPSHOT_TREE_LEVEL)
+        store = WitnessStore.restore(A0, checkpoint.snapshot_A, checkpoint.S, checkpoint.primes,
+                                     checkpoint.witnesses, tree, n)
+    else:
+        for x in checkpoint.S.keys():
+            prime_cache.put(x, checkpoint.primes[x], checkpoint.S[x])
+        store = WitnessStore(A0, checkpoint.S, n)
+    if store.A != (checkpoint.snapshot_A if checkpoint.snapshot_A is not None else A0):
         raise ValueError("Reconstructed accumulator state does not match the saved state.")
-    witnesses, _ = create_all_membership_witnesses(A0, S, n)
-    return witnesses
-
-n, A0, S = setup()
-
-transaction_hashes = main()
-
-x_values = [hash[2:] if hash.startswith('0x') else hash for hash in transaction_hashes]
-
-print("n", hex(n))
-print("A0", A0)
-print("S", S)
-print("x:", x_values)
-
-checkpoint_manager = CheckpointManager(checkpoint_interval=10)
-
-all_transactions = []
-for i in range(0, len(x_values), 10):
-    batch = x_values[i:i + 10]
-    A1, Map = batch_add(A0, S, batch, n)
-    all_transactions.extend(batch)
-    A0 = A1  
-
-    if checkpoint_manager.should_save_checkpoint():
-        checkpoint_manager.save_checkpoint(checkpoint_manager.batch_counter, A0, all_transactions)
-        print(f"Checkpoint saved for batch {checkpoint_manager.batch_counter}")
-
-checkpoint_manager.save_checkpoint(checkpoint_manager.batch_counter, A0, all_transactions)
-
-A_checkpoint, transactions_checkpoint = checkpoint_manager.load_checkpoint(checkpoint_manager.batch_counter)
-witnesses = reconstruct_witnesses(A_checkpoint, transactions_checkpoint, n)
-
-with open('witness.json', 'w') as f:
-    json.dump(witnesses, f, indent=4, default=str)
-
-with open('hashes.json', 'w') as f:
-    json.dump(Map, f, indent=4, default=str)
 
-for i in range(len(x_values)):
-    result, hash = verify_membership(A1, x_values[i], 0, witnesses[i], n)
-    print(result, hash)
+    for _, elements, A in checkpoint.batches:
+        store.batch_add([x for x, _, _ in elements], {x: (prime, nonce) for x, prime, nonce in elements})
+        if store.A != A:
+            raise ValueError("Reconstructed accumulator state does not match the saved state.")
+    return store
+
+if __name__ == '__main__':
+    n, A0, S, _ = setup_from_keystore()
+
+    transaction_hashes = main()
+
+    x_values = [hash[2:] if hash.startswith('0x') else hash for hash in transaction_hashes]
+
+    print("n", hex(n))
+    print("A0", A0)
+    print("S", S)
+    print("x:", x_values)
+
+    checkpoint_manager = CheckpointManager(sync_interval=1, snapshot_interval=10)
+    checkpoint = checkpoint_manager.recover()
+    checkpoint_chain = CheckpointChain()
+    checkpoint_chain.recover(checkpoint.batch_num if checkpoint is not None else 0)
+    if checkpoint is not None:
+        store = reconstruct_witnesses(checkpoint, n)
+        S = store.S
+        print(f"Recovered {len(S)} elements up to batch {checkpoint.batch_num}")
+    else:
+        store = WitnessStore(A0, S, n)
+
+    for i in range(0, len(x_values), 10):
+        batch = list(dict.fromkeys(x for x in x_values[i:i + 10] if x not in store.S))
+        if len(batch) == 0:
+            continue
+        A_before = store.A
+        A1 = store.batch_add(batch)  # witnesses are updated with the batch, no full regeneration
+        # the NI-PoE of the transition goes into the audit chain before the batch is checkpointed
+        proof = prove_transition(A_before, [store.primes[x] for x in batch], A1, n)
+        checkpoint_chain.append(checkpoint_manager.batch_counter + 1, batch, store.S, A_before, A1, proof)
+        # appends only the delta of the batch, the witnesses and the tree go into the periodic snapshots
+        checkpoint_manager.log_batch(batch, store.S, store.primes, A1, store.witnesses, store.tree)
+    checkpoint_manager.close()
+    checkpoint_chain.close()
+    witnesses = store.witnesses
+
+    write_state(n, store.A, store.S, store.primes, witnesses)
+    prime_cache.save()
+
+    for x in x_values:
+        result = verify_membership(store.A, x, store.S[x], witnesses[x], n)
+        print(result, store.primes[x])
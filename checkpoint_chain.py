@@ -0,0 +1,177 @@
+# Append-only chain of the checkpoint transitions, with an NI-PoE (BBF18 PoE, see prove_exponentiation) for each.
+#
+# A transition is one ingested batch: A_after = A_before^(p_1 * ... * p_k) for the primes of its elements. The
+# manager proves it with prove_exponentiation, and a light client checks it with
+# batch_verify_membership_with_NIPoE: Q^l * A_before^(x mod l) == A_after for the 128-bit challenge prime l. That
+# is two exponentiations of ~128 bits per transition, instead of raising A_before to the whole product again
+# (as batchRsa.py's verify_batch_witnesses does). The transitions are independent once their ends are known,
+# so they are checked in parallel, and the chain is checked to link from the trusted A0 to the last A.
+#
+# Unlike the write-ahead log of checkpoint_log.py the chain is never compacted, it is the history the
+# auditors check. Every record is written and fsynced before the batch is logged as a checkpoint.
+#
+# Record (integers big-endian):
+#   payload length (4 bytes) | crc32 of the payload (4 bytes) | payload
+#   payload: batch number (8 bytes) | count (4 bytes) | A before | A after | Q (384 bytes each) |
+#            l nonce (16 bytes) | count * (element (32 bytes) | nonce (16 bytes))
+import os
+import struct
+import sys
+import time
+import zlib
+from multiprocessing import cpu_count
+
+from allFunctions import batch_verify_membership_with_NIPoE, prove_exponentiation
+from keystore import KEYSTORE_PATH, load_keystore
+from parallel_pow import get_pool
+from product_tree import calculate_product
+from state_file import ELEMENT_SIZE, MODULUS_SIZE, NONCE_SIZE, element_to_bytes
+
+CHAIN_PATH = os.path.join('checkpoints', 'chain.log')
+RECORD_HEADER_FORMAT = '>II'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+TRANSITION_HEADER_FORMAT = '>QI'
+TRANSITION_HEADER_SIZE = struct.calcsize(TRANSITION_HEADER_FORMAT)
+CHAIN_ENTRY_SIZE = ELEMENT_SIZE + NONCE_SIZE
+
+
+# One checkpoint transition: elements and nonces of the batch, the accumulator before and after it and the
+# NI-PoE (Q, l_nonce) of A_after = A_before^(product of the primes of the elements).
+class Transition:
+    def __init__(self, batch_num, A_before, A_after, Q, l_nonce, elements, nonces):
+        self.batch_num = batch_num
+        self.A_before = A_before
+        self.A_after = A_after
+        self.Q = Q
+        self.l_nonce = l_nonce
+        self.elements = elements
+        self.nonces = nonces
+
+
+# NI-PoE of a transition, primes - the primes of the batch's elements
+def prove_transition(A_before, primes, A_after, n, trapdoor=None):
+    return prove_exponentiation(A_before, calculate_product(primes), A_after, n, trapdoor)
+
+
+# The light client's check of one transition: hashes the elements to their primes and verifies the NI-PoE.
+def verify_transition(transition, n):
+    return batch_verify_membership_with_NIPoE(transition.Q, transition.l_nonce, transition.A_before,
+                                              transition.elements, transition.nonces, transition.A_after, n)
+
+
+# Batch numbers of the transitions that fail, [] if the whole chain is valid. A transition fails on a wrong
+# NI-PoE, or when it does not start where the previous one ended (A0 for the first one).
+# workers - processes for the NI-PoE checks (all the cores by default, 1 = in this process)
+def verify_checkpoint_chain(transitions, A0, n, workers=None):
+    transitions = list(transitions)
+    failed = set()
+    A = A0
+    for transition in transitions:
+        if transition.A_before != A:
+            failed.add(transition.batch_num)
+        A = transition.A_after
+
+    if workers is None:
+        workers = cpu_count()
+    if workers <= 1 or len(transitions) < 2:
+        results = [verify_transition(transition, n) for transition in transitions]
+    else:
+        chunk_size = max(1, len(transitions) // (4 * workers))
+        results = get_pool(workers).map(verify_transition, transitions, [n] * len(transitions), chunksize=chunk_size)
+    for transition, valid in zip(transitions, results):
+        if not valid:
+            failed.add(transition.batch_num)
+    return sorted(failed)
+
+
+class CheckpointChain:
+    def __init__(self, path=CHAIN_PATH):
+        self.path = path
+        self.__file = None
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # Appends the transition of a batch and its proof. S - x -> nonce for (at least) the batch's elements.
+    def append(self, batch_num, batch, S, A_before, A_after, proof):
+        Q, l_nonce = proof
+        payload = struct.pack(TRANSITION_HEADER_FORMAT, batch_num, len(batch)) + \
+            A_before.to_bytes(MODULUS_SIZE, 'big') + A_after.to_bytes(MODULUS_SIZE, 'big') + \
+            Q.to_bytes(MODULUS_SIZE, 'big') + l_nonce.to_bytes(NONCE_SIZE, 'big') + \
+            b''.join(element_to_bytes(x) + S[x].to_bytes(NONCE_SIZE, 'big') for x in batch)
+        if self.__file is None:
+            self.__file = open(self.path, 'ab')
+        self.__file.write(struct.pack(RECORD_HEADER_FORMAT, len(payload), zlib.crc32(payload)) + payload)
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    # All the transitions in the chain, in order. A record cut off by a crash ends the chain.
+    def transitions(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        return [transition for _, transition in self.__records(data)]
+
+    # Drops a torn record at the end and the transitions after batch_num: those were proven, but the process
+    # stopped before their batch reached the checkpoint log, and they are ingested (and appended) again.
+    def recover(self, batch_num):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        end = 0
+        for offset, transition in self.__records(data):
+            if transition.batch_num > batch_num:
+                break
+            end = offset
+        if end != len(data):
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    # (offset after the record, Transition) for every complete record
+    @staticmethod
+    def __records(data):
+        offset = 0
+        while offset + RECORD_HEADER_SIZE <= len(data):
+            length, crc = struct.unpack_from(RECORD_HEADER_FORMAT, data, offset)
+            payload = data[offset + RECORD_HEADER_SIZE:offset + RECORD_HEADER_SIZE + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                return
+            offset += RECORD_HEADER_SIZE + length
+
+            batch_num, count = struct.unpack_from(TRANSITION_HEADER_FORMAT, payload)
+            position = TRANSITION_HEADER_SIZE
+            values = []
+            for size in (MODULUS_SIZE, MODULUS_SIZE, MODULUS_SIZE, NONCE_SIZE):
+                values.append(int.from_bytes(payload[position:position + size], 'big'))
+                position += size
+            elements, nonces = [], []
+            for _ in range(count):
+                elements.append(payload[position:position + ELEMENT_SIZE].hex())
+                nonces.append(int.from_bytes(payload[position + ELEMENT_SIZE:position + CHAIN_ENTRY_SIZE], 'big'))
+                position += CHAIN_ENTRY_SIZE
+            yield offset, Transition(batch_num, *values, elements, nonces)
+
+
+# Verifies the chain against the keystore's n and A0: python checkpoint_chain.py [chain path] [keystore path]
+if __name__ == '__main__':
+    chain_path = sys.argv[1] if len(sys.argv) > 1 else CHAIN_PATH
+    keystore = load_keystore(sys.argv[2] if len(sys.argv) > 2 else KEYSTORE_PATH)
+    if keystore is None:
+        sys.exit("no keystore")
+    n, A0, _ = keystore
+    transitions = CheckpointChain(chain_path).transitions()
+    start = time.time()
+    failed = verify_checkpoint_chain(transitions, A0, n)
+    print(f"{len(transitions)} transitions checked in {time.time() - start:.2f}s")
+    if len(failed) != 0:
+        print("failed batches:", failed)
+        sys.exit(1)
+    if len(transitions) != 0:
+        print("A", hex(transitions[-1].A_after))
@@ -0,0 +1,245 @@
+# Checkpoints of the accumulator as an append-only write-ahead log plus periodic compacted snapshots.
+#
+# Every ingested batch appends one record with only its delta - the new elements, their primes and nonces and
+# the resulting accumulator - so the cost of a checkpoint is proportional to the batch, not to the history.
+# Every snapshot_interval batches the whole state is compacted into a snapshot and the log starts over, and
+# recovery loads the last snapshot and returns the batches logged after it.
+#
+# A snapshot also holds the membership witnesses and the upper levels of the product tree of the primes, so
+# that a restarted node serves witnesses again after redoing only the batches logged since the snapshot:
+# neither root_factor over the whole set nor the big multiplications of the tree are repeated.
+#
+# Log record (integers big-endian):
+#   payload length (4 bytes) | crc32 of the payload (4 bytes) | payload
+#   payload: batch number (8 bytes) | count (4 bytes) | count * (element | prime | nonce) | A (384 bytes)
+# Snapshot:
+#   magic (8 bytes) | batch number (8 bytes) | count (8 bytes) | witnesses flag (1 byte) | A (384 bytes)
+#   count * (element | prime | nonce [| witness (384 bytes)])
+#   first stored tree level (4 bytes) | number of stored levels (4 bytes)
+#   per level: number of nodes (4 bytes), per node: length (4 bytes) | node
+# A record cut off by a crash fails its length or crc check; recovery drops it and everything after it.
+import os
+import struct
+import zlib
+
+from state_file import ELEMENT_SIZE, MODULUS_SIZE, NONCE_SIZE, PRIME_SIZE, element_to_bytes
+
+LOG_NAME = 'checkpoint.log'
+SNAPSHOT_NAME = 'snapshot.bin'
+SNAPSHOT_MAGIC = b'RSACKP01'
+RECORD_HEADER_FORMAT = '>II'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+BATCH_HEADER_FORMAT = '>QI'
+SNAPSHOT_HEADER_FORMAT = '>QQ?'
+LEVELS_HEADER_FORMAT = '>II'
+LENGTH_FORMAT = '>I'
+LENGTH_SIZE = struct.calcsize(LENGTH_FORMAT)
+ENTRY_SIZE = ELEMENT_SIZE + PRIME_SIZE + NONCE_SIZE
+SNAPSHOT_TREE_LEVEL = 8  # tree levels from here up (nodes over 256 primes) are stored with a snapshot
+
+
+# What recover() found: the state at the last snapshot and the batches logged after it.
+#   S, primes, witnesses - x -> nonce, prime, witness at the snapshot (witnesses is None if not stored)
+#   tree_levels - stored product tree levels from SNAPSHOT_TREE_LEVEL up (None if not stored)
+#   batches - [(batch number, [(x, prime, nonce)], A)] logged after the snapshot
+#   batch_num, A - the last batch and the accumulator after it
+class Checkpoint:
+    def __init__(self):
+        self.snapshot_batch_num = 0
+        self.snapshot_A = None
+        self.S = dict()
+        self.primes = dict()
+        self.witnesses = None
+        self.tree_levels = None
+        self.batches = []
+
+    @property
+    def batch_num(self):
+        return self.batches[-1][0] if len(self.batches) != 0 else self.snapshot_batch_num
+
+    @property
+    def A(self):
+        return self.batches[-1][2] if len(self.batches) != 0 else self.snapshot_A
+
+
+class CheckpointManager:
+    # sync_interval - the log is fsynced every sync_interval batches (and on snapshots and close)
+    # snapshot_interval - a compacted snapshot is written every snapshot_interval batches
+    def __init__(self, checkpoint_dir='checkpoints', sync_interval=1, snapshot_interval=100):
+        self.checkpoint_dir = checkpoint_dir
+        self.sync_interval = sync_interval
+        self.snapshot_interval = snapshot_interval
+        self.batch_counter = 0
+        self.log_path = os.path.join(checkpoint_dir, LOG_NAME)
+        self.snapshot_path = os.path.join(checkpoint_dir, SNAPSHOT_NAME)
+        self.__log = None
+        self.__unsynced = 0
+
+        if not os.path.exists(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+
+    # Appends the delta of one ingested batch. S - x -> nonce and primes - x -> prime hold (at least) the
+    # elements of the batch, A is the accumulator after it. witnesses and tree (the product tree of the primes
+    # in the order of S) go into the periodic snapshots.
+    def log_batch(self, batch, S, primes, A, witnesses=None, tree=None):
+        batch = list(dict.fromkeys(batch))
+        entries = self.__encode_entries(batch, S, primes)  # raises ValueError before anything is counted or written
+        self.batch_counter += 1
+        payload = struct.pack(BATCH_HEADER_FORMAT, self.batch_counter, len(batch)) + entries + \
+            A.to_bytes(MODULUS_SIZE, 'big')
+        log = self.__open_log()
+        log.write(struct.pack(RECORD_HEADER_FORMAT, len(payload), zlib.crc32(payload)) + payload)
+        self.__unsynced += 1
+        if self.__unsynced >= self.sync_interval:
+            self.sync()
+
+        if self.batch_counter % self.snapshot_interval == 0:
+            self.save_snapshot(S, primes, A, witnesses, tree)
+
+    # Writes the whole state (S in insertion order) as the snapshot of the current batch and empties the log.
+    def save_snapshot(self, S, primes, A, witnesses=None, tree=None):
+        keys = list(S.keys())
+        parts = [SNAPSHOT_MAGIC, struct.pack(SNAPSHOT_HEADER_FORMAT, self.batch_counter, len(keys),
+                                             witnesses is not None), A.to_bytes(MODULUS_SIZE, 'big'),
+                 self.__encode_entries(keys, S, primes, witnesses)]
+        upper_levels = tree[SNAPSHOT_TREE_LEVEL:] if tree is not None else []
+        parts.append(struct.pack(LEVELS_HEADER_FORMAT, SNAPSHOT_TREE_LEVEL if tree is not None else 0,
+                                 len(upper_levels)))
+        for level in upper_levels:
+            parts.append(struct.pack(LENGTH_FORMAT, len(level)))
+            for node in level:
+                node_bytes = node.to_bytes((node.bit_length() + 7) // 8, 'big')
+                parts.append(struct.pack(LENGTH_FORMAT, len(node_bytes)) + node_bytes)
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        sync_directory(self.checkpoint_dir)
+
+        # the records up to this batch are in the snapshot now. If the process stops before the log is
+        # emptied, recovery skips them by their batch number.
+        if self.__log is not None:
+            self.__log.close()
+        self.__log = open(self.log_path, 'wb')
+        self.__sync_log()
+
+    # Returns the Checkpoint of the last logged batch, None if nothing was logged.
+    # The manager continues counting batches from there.
+    def recover(self):
+        checkpoint = Checkpoint()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'rb') as f:
+                data = f.read()
+            self.__decode_snapshot(data, checkpoint)
+
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                data = f.read()
+            offset = 0
+            while offset + RECORD_HEADER_SIZE <= len(data):
+                length, crc = struct.unpack_from(RECORD_HEADER_FORMAT, data, offset)
+                payload = data[offset + RECORD_HEADER_SIZE:offset + RECORD_HEADER_SIZE + length]
+                if len(payload) != length or zlib.crc32(payload) != crc:
+                    break
+                offset += RECORD_HEADER_SIZE + length
+
+                record_num, count = struct.unpack_from(BATCH_HEADER_FORMAT, payload)
+                if record_num <= checkpoint.batch_num:
+                    continue
+                entries_offset = struct.calcsize(BATCH_HEADER_FORMAT)
+                S, primes = dict(), dict()
+                self.__decode_entries(payload, entries_offset, count, S, primes)
+                A = int.from_bytes(payload[entries_offset + count * ENTRY_SIZE:], 'big')
+                checkpoint.batches.append((record_num, [(x, primes[x], S[x]) for x in S.keys()], A))
+            if offset != len(data):
+                # torn write at the end of the log: cut it off so that new records follow the last good one
+                with open(self.log_path, 'r+b') as f:
+                    f.truncate(offset)
+
+        self.batch_counter = checkpoint.batch_num
+        if checkpoint.A is None:
+            return None
+        return checkpoint
+
+    def sync(self):
+        if self.__log is not None:
+            self.__sync_log()
+
+    def close(self):
+        if self.__log is not None:
+            self.__sync_log()
+            self.__log.close()
+            self.__log = None
+
+    def __open_log(self):
+        if self.__log is None:
+            self.__log = open(self.log_path, 'ab')
+        return self.__log
+
+    def __sync_log(self):
+        self.__log.flush()
+        os.fsync(self.__log.fileno())
+        self.__unsynced = 0
+
+    def __decode_snapshot(self, data, checkpoint):
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            raise ValueError("not an accumulator snapshot")
+        offset = len(SNAPSHOT_MAGIC)
+        checkpoint.snapshot_batch_num, count, has_witnesses = struct.unpack_from(SNAPSHOT_HEADER_FORMAT, data, offset)
+        offset += struct.calcsize(SNAPSHOT_HEADER_FORMAT)
+        checkpoint.snapshot_A = int.from_bytes(data[offset:offset + MODULUS_SIZE], 'big')
+        offset += MODULUS_SIZE
+        if has_witnesses:
+            checkpoint.witnesses = dict()
+        offset = self.__decode_entries(data, offset, count, checkpoint.S, checkpoint.primes, checkpoint.witnesses)
+
+        first_level, num_of_levels = struct.unpack_from(LEVELS_HEADER_FORMAT, data, offset)
+        offset += struct.calcsize(LEVELS_HEADER_FORMAT)
+        if first_level == 0:
+            return
+        checkpoint.tree_levels = []
+        for _ in range(num_of_levels):
+            num_of_nodes = struct.unpack_from(LENGTH_FORMAT, data, offset)[0]
+            offset += LENGTH_SIZE
+            level = []
+            for _ in range(num_of_nodes):
+                length = struct.unpack_from(LENGTH_FORMAT, data, offset)[0]
+                offset += LENGTH_SIZE
+                level.append(int.from_bytes(data[offset:offset + length], 'big'))
+                offset += length
+            checkpoint.tree_levels.append(level)
+
+    @staticmethod
+    def __encode_entries(keys, S, primes, witnesses=None):
+        return b''.join(element_to_bytes(x) + primes[x].to_bytes(PRIME_SIZE, 'big') +
+                        S[x].to_bytes(NONCE_SIZE, 'big') +
+                        (witnesses[x].to_bytes(MODULUS_SIZE, 'big') if witnesses is not None else b'')
+                        for x in keys)
+
+    # returns the offset after the entries
+    @staticmethod
+    def __decode_entries(data, offset, count, S, primes, witnesses=None):
+        for _ in range(count):
+            x = data[offset:offset + ELEMENT_SIZE].hex()
+            offset += ELEMENT_SIZE
+            primes[x] = int.from_bytes(data[offset:offset + PRIME_SIZE], 'big')
+            offset += PRIME_SIZE
+            S[x] = int.from_bytes(data[offset:offset + NONCE_SIZE], 'big')
+            offset += NONCE_SIZE
+            if witnesses is not None:
+                witnesses[x] = int.from_bytes(data[offset:offset + MODULUS_SIZE], 'big')
+                offset += MODULUS_SIZE
+        return offset
+
+
+def sync_directory(path):
+    # makes the rename of the snapshot durable
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
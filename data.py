@@ -1,6 +1,8 @@
 from web3 import Web3 
 import json
 
+from async_data import main_async
+
 infura_url = 'https://mainnet.infura.io/v3/4949d498183947b9915ffa888117be42'
 web3 = Web3(Web3.HTTPProvider(infura_url))
 
@@ -28,7 +30,15 @@ def fetch_block_data(block_number):
 
     return transaction_hashes , transaction_receipts
 
-def main():
+# async_mode - fetch the blocks and receipts concurrently with batched JSON-RPC calls (see async_data.py)
+def main(async_mode=False):
+    if async_mode:
+        hashes, receipts, transactions = main_async(infura_url, start_block, end_block)
+        all_transaction_hashes.extend(hashes)
+        all_transaction_receipts.extend(receipts)
+        map_transactions.update(transactions)
+        return all_transaction_hashes
+
     for i in range(n):
         current_block_number = start_block + i
         hashes, receipts = fetch_block_data(current_block_number)
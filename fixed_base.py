@@ -0,0 +1,58 @@
+# Fixed-base exponentiation for a base that never changes, such as the accumulator's A0.
+#
+# The table keeps g_j = g^(256^j) for every byte j of the exponent. For e = sum e_j * 256^j (bytes e_j):
+#   g^e = prod_j g_j^(e_j) = prod_(d=1..255) (prod_(j: e_j = d) g_j)^d
+# (Brickell, Gordon, McCurley and Wilson). The inner products take one multiplication per byte and the
+# outer one is 2 * 255 multiplications with a running product, so an exponentiation costs about bits / 8
+# multiplications and no squarings, instead of one squaring per bit for pow.
+#
+# The table grows with the largest exponent seen (one value of the modulus size per byte of exponent), up to
+# max_bits. Above that, the high part of the exponent is done with pow from g^(256^len(table)).
+# The exponents of A0 are products of the 128-bit primes of S, so the default covers sets of ~8000 elements
+# (2^17 table entries, ~50 MB for a 3072-bit modulus). Larger sets pass max_bits, about 128 bits per element
+# and modulus size / 8 bytes of memory per 8 bits.
+DIGIT_BITS = 8
+DEFAULT_MAX_BITS = 1 << 20
+
+
+class FixedBaseTable:
+    # precompute_bits - exponent size the table is built for right away
+    def __init__(self, g, n, precompute_bits=0, max_bits=DEFAULT_MAX_BITS):
+        self.g = g % n
+        self.n = n
+        self.max_bits = max_bits
+        self.powers = []
+        self.__next = self.g  # g^(256^len(powers))
+        self.extend(precompute_bits)
+
+    # Grows the table to cover exponents of num_of_bits bits (at most max_bits).
+    def extend(self, num_of_bits):
+        num_of_bits = min(num_of_bits, self.max_bits)
+        count = -(-num_of_bits // DIGIT_BITS)
+        while len(self.powers) < count:
+            self.powers.append(self.__next)
+            self.__next = pow(self.__next, 1 << DIGIT_BITS, self.n)
+
+    # pow(g, e, n), e >= 0
+    def pow(self, e):
+        self.extend(e.bit_length())
+        capacity = len(self.powers) * DIGIT_BITS
+        high = e >> capacity
+        low = e & ((1 << capacity) - 1)
+
+        n = self.n
+        buckets = [1] * (1 << DIGIT_BITS)
+        for power, digit in zip(self.powers, low.to_bytes(len(self.powers), 'little')):
+            if digit:
+                buckets[digit] = buckets[digit] * power % n
+        result = 1
+        running = 1
+        for digit in range(len(buckets) - 1, 0, -1):
+            if buckets[digit] != 1:
+                running = running * buckets[digit] % n
+            if running != 1:
+                result = result * running % n
+
+        if high:
+            result = result * pow(self.__next, high, n) % n
+        return result
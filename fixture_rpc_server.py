@@ -0,0 +1,86 @@
+# Local stand-in for an Ethereum JSON-RPC node, serving the transactions stored in transactions.json
+# (tx hash -> receipt, as written by data.py). Answers eth_getBlockByNumber (transaction hashes only) and
+# eth_getTransactionReceipt, single and batch calls, so the ingestion can be run and timed without Infura.
+#
+#   python fixture_rpc_server.py [port]
+# and point async_data / data.py at http://127.0.0.1:<port>.
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURE_PATH = 'transactions.json'
+DEFAULT_PORT = 8545
+
+
+class FixtureRPCServer(ThreadingHTTPServer):
+    # latency - seconds every call waits before answering, to stand in for the round trip to a remote node
+    def __init__(self, address, fixture_path=FIXTURE_PATH, latency=0.0):
+        super().__init__(address, FixtureRPCHandler)
+        self.latency = latency
+        self.blocks = {}
+        self.receipts = {}
+        with open(fixture_path, 'r') as f:
+            fixtures = json.load(f)
+        for tx_hash, receipt in fixtures.items():
+            if isinstance(receipt, str):
+                # data.py stores the receipts as their printed form: keep it, read the block number out of it
+                block_number = int(re.search(r"'blockNumber': (\d+)", receipt).group(1))
+                receipt = {'transactionHash': tx_hash, 'blockNumber': hex(block_number), 'raw': receipt}
+            else:
+                block_number = int(receipt['blockNumber'], 0) if isinstance(receipt['blockNumber'], str) \
+                    else receipt['blockNumber']
+            self.blocks.setdefault(block_number, []).append(tx_hash)
+            self.receipts[tx_hash] = receipt
+
+    def answer(self, request):
+        method = request.get('method')
+        params = request.get('params', [])
+        reply = {'jsonrpc': '2.0', 'id': request.get('id')}
+        if method == 'eth_getBlockByNumber':
+            block_number = int(params[0], 16)
+            hashes = self.blocks.get(block_number)
+            reply['result'] = None if hashes is None else {'number': hex(block_number), 'transactions': hashes}
+        elif method == 'eth_getTransactionReceipt':
+            reply['result'] = self.receipts.get(params[0])
+        else:
+            reply['error'] = {'code': -32601, 'message': f"method {method} not found"}
+        return reply
+
+
+class FixtureRPCHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so that the clients can pool their connections
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if isinstance(body, list):
+            reply = [self.server.answer(request) for request in body]
+        else:
+            reply = self.server.answer(body)
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Starts the server in a background thread, returns it (server.server_address holds the port, 0 picks one).
+def serve_fixtures(port=DEFAULT_PORT, fixture_path=FIXTURE_PATH, latency=0.0):
+    server = FixtureRPCServer(('127.0.0.1', port), fixture_path, latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    server = FixtureRPCServer(('127.0.0.1', port))
+    print(f"serving {len(server.receipts)} transactions of blocks {sorted(server.blocks)} on port {port}")
+    server.serve_forever()
@@ -0,0 +1,236 @@
+# Opt-in instrumentation of the accumulator's hot paths.
+#
+# enable() wraps the primitives - pow, calculate_product, hash_to_prime, batch_hash_to_prime and is_prime - and
+# the prover, verifier and tree functions (the phases) in the accumulator modules, and disable() puts the
+# original functions back. Nothing is wrapped while it is disabled, so it costs nothing then.
+#
+# Every primitive call is counted and timed under the innermost phase it runs in, and the bit lengths of
+# the exponents of pow (and of the products of calculate_product, the candidates of is_prime) go into
+# histograms. stats() returns the data and prometheus_text() the Prometheus text format of it, e.g.
+#   instrumentation.enable()
+#   store.batch_add(batch)
+#   print(instrumentation.prometheus_text())
+#
+# The wrappers replace the functions wherever they were imported (from x import f), but calls made in
+# other processes (the process pools) are not recorded.
+import builtins
+import functools
+import importlib
+import sys
+import threading
+import time
+
+# modules whose calls are recorded, pow is wrapped in these only
+TARGET_MODULES = ['allFunctions', 'witness_store', 'product_tree', 'primality', 'prime_sieve', 'trapdoor',
+                  'fixed_base', 'witness_stream', 'witness_aggregation', 'batch_verify', 'member_product', 'xgcd',
+                  'checkpoint_chain']
+# (module, function, label, what the histogram measures)
+PRIMITIVES = [('product_tree', 'calculate_product', 'calculate_product', 'result'),
+              ('helpfunctions', 'hash_to_prime', 'hash_to_prime', None),
+              ('prime_sieve', 'hash_to_prime', 'sieve_hash_to_prime', None),
+              ('prime_sieve', 'batch_hash_to_prime', 'batch_hash_to_prime', None),
+              ('primality', 'is_prime', 'is_prime', 'argument')]
+# (module, class or None, functions)
+PHASES = [
+    ('allFunctions', None, ['add', 'batch_add', 'prove_membership', 'batch_prove_membership',
+                            'prove_non_membership', 'batch_prove_non_membership', 'prove_exponentiation',
+                            'verify_membership', 'batch_verify_membership', 'verify_non_membership',
+                            'batch_verify_non_membership', 'verify_exponentiation',
+                            'batch_verify_membership_with_NIPoE', 'delete', 'batch_delete',
+                            'batch_delete_using_membership_proofs',
+                            'batch_delete_using_membership_proofs_without_NIPoE',
+                            'update_membership_witnesses_on_delete',
+                            'create_all_membership_witnesses', 'stream_all_membership_witnesses', 'root_factor',
+                            'aggregate_membership_witnesses']),
+    ('witness_store', 'WitnessStore', ['batch_add', 'delete', 'batch_delete']),
+    ('product_tree', None, ['product_tree', 'tree_root_factor', 'tree_remainders']),
+    ('batch_verify', None, ['batch_verify_witnesses']),
+]
+BIT_BUCKETS = [1 << i for i in range(7, 25)]  # 128 bits ... 16 Mbit, and +Inf
+NO_PHASE = ''
+
+__patched = []  # (namespace, name, original or None if the name was not there)
+__operations = {}  # (function, phase) -> [calls, seconds, bit bucket counts, sum of bits]
+__phases = {}  # phase -> [calls, seconds]
+__local = threading.local()
+
+
+def enable():
+    if __patched:
+        return
+    for name in TARGET_MODULES:
+        importlib.import_module(name)
+
+    replacements = {}
+    for module_name, function_name, label, measure in PRIMITIVES:
+        module = sys.modules.get(module_name) or __import_optional(module_name)
+        original = getattr(module, function_name, None) if module is not None else None
+        if original is not None and id(original) not in replacements:
+            replacements[id(original)] = __primitive_wrapper(label, original, measure)
+    for module_name, class_name, function_names in PHASES:
+        owner = importlib.import_module(module_name)
+        if class_name is not None:
+            owner = getattr(owner, class_name)
+        prefix = class_name if class_name is not None else module_name
+        for function_name in function_names:
+            original = owner.__dict__.get(function_name)
+            if original is None:
+                continue
+            wrapper = __phase_wrapper(f"{prefix}.{function_name}", original)
+            if class_name is not None:
+                __patch(owner, function_name, wrapper)
+            else:
+                replacements[id(original)] = wrapper
+
+    # every alias of a wrapped function in every loaded module, so that pickling by reference still finds the
+    # same object it is given
+    for module in list(sys.modules.values()):
+        namespace = getattr(module, '__dict__', None)
+        if namespace is None:
+            continue
+        for name, value in list(namespace.items()):
+            if callable(value) and id(value) in replacements:
+                __patch(module, name, replacements[id(value)])
+
+    pow_wrapper = __primitive_wrapper('pow', builtins.pow, 'exponent')
+    for name in TARGET_MODULES:
+        __patch(sys.modules[name], 'pow', pow_wrapper)
+
+
+def disable():
+    while __patched:
+        owner, name, original = __patched.pop()
+        if original is None:
+            delattr(owner, name)
+        else:
+            setattr(owner, name, original)
+
+
+def enabled():
+    return len(__patched) != 0
+
+
+def reset():
+    __operations.clear()
+    __phases.clear()
+
+
+# {'phases': {phase: {'calls', 'seconds'}},
+#  'operations': {function: {phase: {'calls', 'seconds', 'bits': {bucket upper bound: count}, 'bits_sum'}}}}
+# The bucket bounds are bit lengths (the last one is 'inf'), the phase of calls made outside every phase is ''.
+def stats():
+    operations = {}
+    for (function, phase), (calls, seconds, buckets, bits_sum) in __operations.items():
+        bounds = [str(bound) for bound in BIT_BUCKETS] + ['inf']
+        operations.setdefault(function, {})[phase] = {
+            'calls': calls, 'seconds': seconds, 'bits_sum': bits_sum,
+            'bits': {bound: count for bound, count in zip(bounds, buckets) if count}}
+    phases = {phase: {'calls': calls, 'seconds': seconds} for phase, (calls, seconds) in __phases.items()}
+    return {'phases': phases, 'operations': operations}
+
+
+def prometheus_text():
+    lines = ['# HELP accumulator_phase_calls_total Calls of the accumulator functions.',
+             '# TYPE accumulator_phase_calls_total counter']
+    for phase, (calls, _) in sorted(__phases.items()):
+        lines.append(f'accumulator_phase_calls_total{{phase="{phase}"}} {calls}')
+    lines += ['# HELP accumulator_phase_seconds_total Time spent in the accumulator functions.',
+              '# TYPE accumulator_phase_seconds_total counter']
+    for phase, (_, seconds) in sorted(__phases.items()):
+        lines.append(f'accumulator_phase_seconds_total{{phase="{phase}"}} {seconds:.9f}')
+
+    lines += ['# HELP accumulator_operation_calls_total Calls of pow, products, hash to prime and primality tests.',
+              '# TYPE accumulator_operation_calls_total counter']
+    for (function, phase), values in sorted(__operations.items()):
+        lines.append(f'accumulator_operation_calls_total{{function="{function}",phase="{phase}"}} {values[0]}')
+    lines += ['# HELP accumulator_operation_seconds_total Time spent in the operations.',
+              '# TYPE accumulator_operation_seconds_total counter']
+    for (function, phase), values in sorted(__operations.items()):
+        lines.append(f'accumulator_operation_seconds_total{{function="{function}",phase="{phase}"}} {values[1]:.9f}')
+
+    lines += ['# HELP accumulator_operation_bits Bit lengths of exponents (pow), products and primality candidates.',
+              '# TYPE accumulator_operation_bits histogram']
+    for (function, phase), (calls, _, buckets, bits_sum) in sorted(__operations.items()):
+        if not any(buckets):
+            continue
+        labels = f'function="{function}",phase="{phase}"'
+        cumulative = 0
+        for bound, count in zip(BIT_BUCKETS, buckets):
+            cumulative += count
+            lines.append(f'accumulator_operation_bits_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'accumulator_operation_bits_bucket{{{labels},le="+Inf"}} {cumulative + buckets[-1]}')
+        lines.append(f'accumulator_operation_bits_sum{{{labels}}} {bits_sum}')
+        lines.append(f'accumulator_operation_bits_count{{{labels}}} {cumulative + buckets[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def __import_optional(module_name):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        return None
+
+
+def __patch(owner, name, value):
+    __patched.append((owner, name, owner.__dict__.get(name)))
+    setattr(owner, name, value)
+
+
+def __current_phase():
+    stack = getattr(__local, 'phases', None)
+    return stack[-1] if stack else NO_PHASE
+
+
+# measure - 'exponent' (pow's second argument), 'argument' (the first argument), 'result' or None
+def __primitive_wrapper(name, function, measure):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        bits = None
+        if measure == 'exponent' and len(args) > 1:
+            bits = abs(args[1]).bit_length()
+        elif measure == 'argument' and len(args) > 0:
+            bits = args[0].bit_length()
+        elif measure == 'result' and isinstance(result, int):
+            bits = result.bit_length()
+        __record(name, elapsed, bits)
+        return result
+
+    if function is not builtins.pow:
+        wrapper = functools.wraps(function)(wrapper)
+    return wrapper
+
+
+def __phase_wrapper(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        stack = getattr(__local, 'phases', None)
+        if stack is None:
+            stack = __local.phases = []
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            values = __phases.setdefault(name, [0, 0.0])
+            values[0] += 1
+            values[1] += elapsed
+    return wrapper
+
+
+def __record(name, elapsed, bits):
+    key = (name, __current_phase())
+    values = __operations.get(key)
+    if values is None:
+        values = __operations[key] = [0, 0.0, [0] * (len(BIT_BUCKETS) + 1), 0]
+    values[0] += 1
+    values[1] += elapsed
+    if bits is not None:
+        index = 0
+        while index < len(BIT_BUCKETS) and bits > BIT_BUCKETS[index]:
+            index += 1
+        values[2][index] += 1
+        values[3] += bits
@@ -0,0 +1,82 @@
+# RSA modulus generation: searches for the primes on all cores at once.
+# Every worker draws random windows of odd candidates, sieves a window against the small primes and runs the
+# BPSW tests only on the survivors. The first worker(s) to find the primes stop all the others.
+# If the workers die (e.g. a spawned worker that re-imports a script without a __main__ guard) the search goes on
+# in this process.
+import queue
+import secrets
+from multiprocessing import Event, Process, Queue, cpu_count
+
+from primality import SMALL_PRIMES, strong_probable_prime, strong_lucas_probable_prime
+
+SIEVE_WINDOW = 4096  # odd candidates per window, a 1536-bit window holds ~8 primes on average
+SIEVE_PRIMES = SMALL_PRIMES[1:]  # odd primes below 2^16
+WORKER_POLL_SECONDS = 1  # how often the parent checks that the workers are still alive
+
+
+def generate_large_prime(num_of_bits, workers=None):
+    return generate_primes(num_of_bits, 1, workers)[0]
+
+
+def generate_two_large_distinct_primes(num_of_bits, workers=None):
+    p, q = generate_primes(num_of_bits, 2, workers)
+    return p, q
+
+
+# Returns count distinct primes of exactly num_of_bits bits, with the two top bits set so that the product
+# of two of them has exactly 2 * num_of_bits bits.
+# workers - number of processes searching in parallel, all the cores by default
+def generate_primes(num_of_bits, count, workers=None):
+    if workers is None:
+        workers = cpu_count()
+    primes = set()
+    if workers > 1:
+        stop = Event()
+        results = Queue()
+        processes = [Process(target=__search_worker, args=(num_of_bits, stop, results), daemon=True)
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+
+        while len(primes) < count:
+            try:
+                primes.add(results.get(timeout=WORKER_POLL_SECONDS))
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    break
+        stop.set()
+        for process in processes:
+            process.join()
+
+    # a single worker, or the workers died: the rest is searched in this process
+    while len(primes) < count:
+        primes.add(next(search_primes(num_of_bits)))
+    return list(primes)
+
+
+# Infinite generator of random primes of num_of_bits bits (checked with BPSW).
+def search_primes(num_of_bits, stop=None):
+    while stop is None or not stop.is_set():
+        start = secrets.randbits(num_of_bits) | (3 << (num_of_bits - 2)) | 1
+        for candidate in sieve_window(start, num_of_bits):
+            if stop is not None and stop.is_set():
+                return
+            if strong_probable_prime(candidate, 2) and strong_lucas_probable_prime(candidate):
+                yield candidate
+
+
+# The candidates start, start + 2, ..., start + 2 * (SIEVE_WINDOW - 1) (start odd) with no factor below 2^16
+# and below 2^num_of_bits.
+def sieve_window(start, num_of_bits):
+    sieve = bytearray([1]) * SIEVE_WINDOW
+    for p in SIEVE_PRIMES:
+        # first i with start + 2i = 0 (mod p)
+        i = (-start) * ((p + 1) // 2) % p
+        sieve[i::p] = bytes(len(range(i, SIEVE_WINDOW, p)))
+    limit = 1 << num_of_bits
+    return [start + 2 * i for i in range(SIEVE_WINDOW) if sieve[i] and start + 2 * i < limit]
+
+
+def __search_worker(num_of_bits, stop, results):
+    for prime in search_primes(num_of_bits, stop):
+        results.put(prime)
@@ -0,0 +1,54 @@
+# Local keystore for the accumulator parameters: (n, A0) and, for the manager only, the trapdoor p, q.
+# Generating a 3072-bit modulus on every run is slow and gives a new accumulator every time, so the scripts
+# load the stored parameters and only generate them on the first run.
+import json
+import os
+import secrets
+
+from keygen import generate_two_large_distinct_primes
+from trapdoor import Trapdoor
+
+KEYSTORE_PATH = 'keystore.json'
+
+
+def save_keystore(n, A0, trapdoor=None, path=KEYSTORE_PATH):
+    keystore = {'n': hex(n), 'A0': hex(A0)}
+    if trapdoor is not None:
+        keystore['p'] = hex(trapdoor.p)
+        keystore['q'] = hex(trapdoor.q)
+    tmp_path = path + '.tmp'
+    # the trapdoor must stay with the manager: the file is only readable by its owner
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(keystore, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+# Returns (n, A0, trapdoor), trapdoor is None if the keystore does not hold one. None if there is no keystore.
+def load_keystore(path=KEYSTORE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        keystore = json.load(f)
+    n = int(keystore['n'], 16)
+    A0 = int(keystore['A0'], 16)
+    trapdoor = None
+    if 'p' in keystore:
+        trapdoor = Trapdoor(int(keystore['p'], 16), int(keystore['q'], 16))
+        if trapdoor.n != n:
+            raise ValueError("keystore trapdoor does not match the modulus")
+    return n, A0, trapdoor
+
+
+# Loads the keystore, or generates new parameters and stores them when there is none.
+# keep_trapdoor - store (and return) p, q when generating. An existing keystore is returned as is.
+def load_or_create_keystore(num_of_bits, path=KEYSTORE_PATH, keep_trapdoor=False):
+    keystore = load_keystore(path)
+    if keystore is not None:
+        return keystore
+    p, q = generate_two_large_distinct_primes(num_of_bits)
+    n = p * q
+    A0 = secrets.randbelow(n)
+    trapdoor = Trapdoor(p, q) if keep_trapdoor else None
+    save_keystore(n, A0, trapdoor, path)
+    return n, A0, trapdoor
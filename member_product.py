@@ -0,0 +1,38 @@
+# The product of the primes of all the accumulated elements, kept between non-membership proofs.
+#
+# A non-membership proof needs P = prod of the primes of S, a multi-megabit integer that used to be rebuilt from
+# every element for every query. Here it is kept for one S and extended with the primes of the elements added
+# since the last call, which are the keys after the first count ones (S is insertion ordered).
+# Deleting from S has to call invalidate(): the product is then rebuilt on the next call.
+import itertools
+
+from product_tree import calculate_product
+
+
+class MemberProduct:
+    def __init__(self):
+        self.invalidate()
+
+    # prod of prime(x, S[x]) over the elements of S
+    def get(self, S, prime):
+        if S is not self.__S or len(S) < self.__count or not self.__is_prefix(S):
+            self.invalidate()
+            self.__S = S
+        if len(S) > self.__count:
+            added = list(itertools.islice(S.keys(), self.__count, None))
+            self.product *= calculate_product([prime(x, S[x]) for x in added])
+            self.__count = len(S)
+            self.__last = added[-1]
+        return self.product
+
+    def invalidate(self):
+        self.__S = None
+        self.__count = 0
+        self.__last = None
+        self.product = 1
+
+    # the element the product ended with is still at its position in S
+    def __is_prefix(self, S):
+        if self.__count == 0:
+            return True
+        return next(itertools.islice(S.keys(), self.__count - 1, None)) == self.__last
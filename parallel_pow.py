@@ -0,0 +1,119 @@
+# Modular exponentiation on several cores: by splitting the exponent into bit slices (parallel_pow), and
+# root_factor over a product tree (parallel_root_factor). Both run on one persistent process pool.
+#
+# With e = e_0 + e_1 * 2^k + ... + e_(w-1) * 2^(k(w-1)) (slices of k bits) and bases B_i = g^(2^(ki)):
+#   g^e = B_0^(e_0) * B_1^(e_1) * ... * B_(w-1)^(e_(w-1))  (mod n)
+# Every B_i^(e_i) is a k-bit exponentiation that runs in its own process, and the result is the same integer
+# as pow(g, e, n).
+#
+# The bases are a chain of squarings: for a base used once they cost as many squarings as the serial pow, so
+# the slices only save the multiplications (and are started as soon as their base is ready, while the chain
+# goes on). The bases of a base that is used again - A0, or the accumulator of a trusted setup - are kept with
+# exponent_bases (split_exponent_bases) and passed in, and then every exponentiation runs on all the cores.
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import cpu_count
+
+from product_tree import tree_root_factor
+
+PARALLEL_POW_CUTOFF = 1 << 16  # exponents with fewer bits are not worth sending to other processes
+PARALLEL_ROOT_FACTOR_CUTOFF = 64  # smaller trees are not worth sending to other processes
+
+__pools = {}
+
+
+# One persistent pool per number of workers, so the processes are started once and not on every call.
+def get_pool(workers=None):
+    if workers is None:
+        workers = cpu_count()
+    if workers not in __pools:
+        __pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return __pools[workers]
+
+
+# [g^(2^(slice_bits * i)) for i in range(count)]
+def split_exponent_bases(g, n, slice_bits, count):
+    bases = [g % n]
+    for _ in range(count - 1):
+        bases.append(pow(bases[-1], 1 << slice_bits, n))
+    return bases
+
+
+# split_exponent_bases of g for exponents of up to max_bits bits with one slice per worker (all the cores by
+# default): (bases, slice_bits) to pass to parallel_pow. Costs the squarings of one serial pow, so it is done once
+# for a base that is used again, e.g. A0 right after the setup.
+def exponent_bases(g, n, max_bits, workers=None):
+    if workers is None:
+        workers = cpu_count()
+    slice_bits = max(1, -(-max_bits // workers))
+    return split_exponent_bases(g, n, slice_bits, -(-max_bits // slice_bits)), slice_bits
+
+
+# pow(g, e, n) on workers processes (all the cores by default).
+# bases, slice_bits - bases from split_exponent_bases(g, n, slice_bits, count), count * slice_bits >= e's bits
+def parallel_pow(g, e, n, workers=None, bases=None, slice_bits=None):
+    if workers is None:
+        workers = cpu_count()
+    if workers <= 1 or e.bit_length() < PARALLEL_POW_CUTOFF:
+        return pow(g, e, n)
+
+    if bases is None:
+        slice_bits = -(-e.bit_length() // workers)
+        count = workers
+    else:
+        count = -(-e.bit_length() // slice_bits)
+        if count > len(bases):
+            raise ValueError("not enough bases for the exponent")
+    mask = (1 << slice_bits) - 1
+    pool = get_pool(workers)
+
+    futures = []
+    base = g % n
+    for i in range(count):
+        if bases is not None:
+            base = bases[i]
+        elif i > 0:
+            base = pow(base, 1 << slice_bits, n)
+        futures.append(pool.submit(pow, base, (e >> (slice_bits * i)) & mask, n))
+
+    result = 1
+    for future in futures:
+        result = result * future.result() % n
+    return result
+
+
+# root_factor over a product tree (see product_tree.tree_root_factor) on workers processes.
+# The top log2(workers) levels of the tree are fanned out: every node's base - g raised to the product of all
+# the leaves outside the node - is computed level by level with the exponentiations of a level running in
+# parallel. Then every subtree at that depth runs tree_root_factor from its base in its own process.
+# Trees with fewer than cutoff leaves are done in this process.
+def parallel_root_factor(g, levels, N, workers=None, cutoff=PARALLEL_ROOT_FACTOR_CUTOFF):
+    if workers is None:
+        workers = cpu_count()
+    if workers <= 1 or len(levels[0]) < cutoff:
+        return tree_root_factor(g, levels, N)
+    pool = get_pool(workers)
+
+    level = len(levels) - 1
+    nodes = [(0, g)]  # (index, base) of the nodes at level
+    for _ in range(min(level, (workers - 1).bit_length())):
+        below = levels[level - 1]
+        children = []
+        for index, base in nodes:
+            left = 2 * index
+            right = left + 1
+            if right == len(below):
+                children.append((left, base))
+            else:
+                children.append((left, pool.submit(pow, base, below[right], N)))
+                children.append((right, pool.submit(pow, base, below[left], N)))
+        nodes = [(index, base if isinstance(base, int) else base.result()) for index, base in children]
+        level -= 1
+
+    futures = [pool.submit(tree_root_factor, base, subtree_levels(levels, level, index), N)
+               for index, base in nodes]
+    return [witness for future in futures for witness in future.result()]
+
+
+# The levels of the subtree under node index of level, node j of a level covers leaves [j * 2^level, ...).
+def subtree_levels(levels, level, index):
+    return [levels[k][index << (level - k):(index + 1) << (level - k)] for k in range(level + 1)]
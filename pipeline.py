@@ -0,0 +1,109 @@
+# Streaming ingest: blocks flow through fetch -> normalize -> hash to prime -> accumulate one block at a time,
+# instead of collecting the transaction hashes of the whole range before the first batch_add.
+#
+# The stages are chained generators with bounded buffers between them:
+#   - stream_block_hashes fetches the blocks with async_data in a background thread into a queue of
+#     queue_size blocks, and drops every receipt as soon as its block's hashes are taken
+#   - hash_batches hashes the elements of a block to primes in worker processes, with at most max_pending
+#     blocks in flight
+#   - accumulate adds each block to a WitnessStore in this process
+# so the network, the hashing and the modular exponentiations overlap, and a slow stage blocks the ones
+# before it instead of letting blocks pile up in memory.
+import asyncio
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from allFunctions import ACCUMULATED_PRIME_SIZE
+from async_data import iter_blocks_async
+from helpfunctions import hash_to_prime
+
+QUEUE_SIZE = 4  # blocks buffered between two stages
+__END = object()
+
+
+# Generator of the transaction hashes of every block in [start_block, end_block), in order.
+def stream_block_hashes(url, start_block, end_block, queue_size=QUEUE_SIZE, **kwargs):
+    blocks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    # blocks while the queue is full, gives up once the consumer is gone
+    def put(item):
+        while not stop.is_set():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def produce():
+        async for _, hashes, receipts in iter_blocks_async(url, start_block, end_block, **kwargs):
+            del receipts  # only the hashes are accumulated
+            if not await asyncio.to_thread(put, hashes):
+                return
+
+    def run():
+        try:
+            asyncio.run(produce())
+            put(__END)
+        except Exception as e:
+            put(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = blocks.get()
+            if item is __END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+# Strips the 0x prefix of the transaction hashes, as rsa.py does.
+def normalize(batches):
+    for batch in batches:
+        yield [x[2:] if x.startswith('0x') else x for x in batch]
+
+
+# Generator of (x_list, [(prime, nonce)]) for every batch, in order. workers processes hash the batches,
+# workers=0 hashes them in this process.
+def hash_batches(batches, workers=1, max_pending=QUEUE_SIZE, num_of_bits=ACCUMULATED_PRIME_SIZE):
+    if workers == 0:
+        for batch in batches:
+            yield batch, hash_block(batch, num_of_bits)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for batch in batches:
+            pending.append((batch, executor.submit(hash_block, batch, num_of_bits)))
+            if len(pending) >= max_pending:
+                batch, future = pending.pop(0)
+                yield batch, future.result()
+        for batch, future in pending:
+            yield batch, future.result()
+
+
+# module level so that it can be sent to worker processes
+def hash_block(x_list, num_of_bits=ACCUMULATED_PRIME_SIZE):
+    return [hash_to_prime(x, num_of_bits) for x in x_list]
+
+
+# Adds every hashed batch to the store, yields the accumulator after each of them.
+def accumulate(hashed_batches, store):
+    for x_list, primes in hashed_batches:
+        yield store.batch_add(x_list, dict(zip(x_list, primes)))
+
+
+# Runs the whole pipeline over the block range into store, returns the final accumulator.
+def ingest(url, start_block, end_block, store, workers=1, queue_size=QUEUE_SIZE, **kwargs):
+    batches = normalize(stream_block_hashes(url, start_block, end_block, queue_size, **kwargs))
+    for _ in accumulate(hash_batches(batches, workers, queue_size), store):
+        pass
+    return store.A
@@ -0,0 +1,138 @@
+# Baillie-PSW primality test: trial division by the small primes, a strong probable prime test to base 2
+# and a strong Lucas probable prime test (Selfridge's parameters). It is deterministic below 2^64 and no
+# composite passing it is known. This is the inner loop of both hash_to_prime and the RSA key generation.
+from math import gcd, isqrt
+
+from product_tree import calculate_product, product_tree, tree_remainders
+
+TRIAL_LIMIT = 1000  # is_prime trial-divides by the primes below this bound
+BATCH_TRIAL_LIMIT = 1 << 16  # batch_is_prime, where the division is shared between the candidates
+
+
+def is_prime(n):
+    if n < TRIAL_LIMIT:
+        return n in SMALL_PRIMES_SET
+    if gcd(n, PRIMORIAL) != 1:
+        return False
+    return strong_probable_prime(n, 2) and strong_lucas_probable_prime(n)
+
+
+# is_prime for many candidates at once. Instead of one gcd per candidate against the large primorial,
+# the primorial is reduced mod every candidate with a remainder tree over the product tree of the candidates.
+def batch_is_prime(candidates):
+    candidates = list(candidates)
+    large = [n for n in candidates if n >= BATCH_TRIAL_LIMIT]
+    # the tree is only useful up to nodes the size of the primorial, above that the primorial is its own
+    # remainder - so the candidates are split into groups whose product is about that size
+    group_size = max(1, BATCH_PRIMORIAL.bit_length() // max(large, default=1).bit_length())
+    remainders = []
+    for i in range(0, len(large), group_size):
+        remainders.extend(tree_remainders(BATCH_PRIMORIAL, product_tree(large[i:i + group_size])))
+
+    results = []
+    remainders = iter(remainders)
+    for n in candidates:
+        if n < BATCH_TRIAL_LIMIT:
+            results.append(n in SMALL_PRIMES_SET)
+        elif gcd(n, next(remainders)) != 1:
+            results.append(False)
+        else:
+            results.append(strong_probable_prime(n, 2) and strong_lucas_probable_prime(n))
+    return results
+
+
+# Miller-Rabin round: n odd, n > base
+def strong_probable_prime(n, base):
+    d = n - 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    x = pow(base, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for _ in range(s - 1):
+        x = pow(x, 2, n)
+        if x == n - 1:
+            return True
+    return False
+
+
+# n odd, not divisible by the small primes
+def strong_lucas_probable_prime(n):
+    r = isqrt(n)
+    if r * r == n:  # no D with jacobi(D, n) == -1 exists
+        return False
+
+    # Selfridge: first D in 5, -7, 9, -11, ... with jacobi(D, n) == -1, P = 1, Q = (1 - D) / 4
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    P = 1
+    Q = (1 - D) // 4
+
+    # n + 1 = d * 2^s, d odd
+    d = n + 1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    # U_d, V_d and Q^d mod n, left to right over the bits of d starting from U_1 = 1, V_1 = P
+    U = 1
+    V = P
+    Q_k = Q % n
+    for bit in bin(d)[3:]:
+        U = U * V % n
+        V = (V * V - 2 * Q_k) % n
+        Q_k = Q_k * Q_k % n
+        if bit == '1':
+            U, V = P * U + V, D * U + P * V
+            U = (U + n if U % 2 else U) // 2 % n
+            V = (V + n if V % 2 else V) // 2 % n
+            Q_k = Q_k * Q % n
+
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V = (V * V - 2 * Q_k) % n
+        if V == 0:
+            return True
+        Q_k = Q_k * Q_k % n
+    return False
+
+
+# Jacobi symbol (a/n), n odd and positive. The factors of 2 are removed with one shift per step.
+def jacobi(a, n):
+    a %= n
+    result = 1
+    while a != 0:
+        zeros = (a & -a).bit_length() - 1
+        a >>= zeros
+        if zeros & 1 and n % 8 in (3, 5):
+            result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def __small_primes(limit):
+    sieve = bytearray([1]) * limit
+    sieve[0:2] = b'\x00\x00'
+    for p in range(2, isqrt(limit) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = bytearray(len(range(p * p, limit, p)))
+    return [p for p in range(limit) if sieve[p]]
+
+
+SMALL_PRIMES = __small_primes(BATCH_TRIAL_LIMIT)
+SMALL_PRIMES_SET = set(SMALL_PRIMES)
+PRIMORIAL = calculate_product([p for p in SMALL_PRIMES if p < TRIAL_LIMIT])
+BATCH_PRIMORIAL = calculate_product(SMALL_PRIMES)
@@ -0,0 +1,58 @@
+# Persistent cache of hash_to_prime results: element -> (prime, nonce).
+# hash_to_prime runs SHA-256 and a primality search, and the provers used to redo it for every element of S
+# on every call. Once an element is accumulated its prime is stored here and read back instead.
+# The file is only read when the cache is first used, and only written by save().
+import json
+import os
+
+PRIME_CACHE_PATH = 'primes_cache.json'
+
+
+class PrimeCache:
+    def __init__(self, path=PRIME_CACHE_PATH):
+        self.path = path
+        self.__entries = None
+        self.__dirty = False
+
+    # the prime of x, if it was stored for the same nonce; None otherwise
+    def get(self, x, nonce):
+        entry = self.__load().get(self.key(x))
+        if entry is None or entry[1] != nonce:
+            return None
+        return entry[0]
+
+    def put(self, x, prime, nonce):
+        entries = self.__load()
+        key = self.key(x)
+        if entries.get(key) != (prime, nonce):
+            entries[key] = (prime, nonce)
+            self.__dirty = True
+
+    def __contains__(self, x):
+        return self.key(x) in self.__load()
+
+    def __len__(self):
+        return len(self.__load())
+
+    def save(self):
+        if not self.__dirty:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({key: [prime, nonce] for key, (prime, nonce) in self.__entries.items()}, f)
+        os.replace(tmp_path, self.path)
+        self.__dirty = False
+
+    # elements are keyed by their hash (the transaction hashes themselves)
+    @staticmethod
+    def key(x):
+        return str(x)
+
+    def __load(self):
+        if self.__entries is None:
+            self.__entries = dict()
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    for key, (prime, nonce) in json.load(f).items():
+                        self.__entries[key] = (prime, nonce)
+        return self.__entries
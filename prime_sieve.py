@@ -0,0 +1,105 @@
+# Batched hash_to_prime for whole blocks of elements (transaction hashes).
+#
+# An element x is mapped to h = the first num_of_bits bits of sha256(bytes.fromhex(x)), and its prime is the
+# first h + nonce (nonce = 0, 1, 2, ...) that is prime; hash_to_prime(x, nonce=k) restarts the search at h + k.
+# Testing the candidates one by one runs a primality test on ~ln(2^128) = 89 integers per element.
+# batch_hash_to_prime instead sieves the search windows [h, h + SIEVE_WINDOW) of a whole block at once with
+# NumPy against the small primes, and only runs the expensive test on the few candidates that survive.
+import hashlib
+
+import numpy as np
+
+from primality import is_prime, strong_probable_prime, strong_lucas_probable_prime
+
+SIEVE_WINDOW = 512  # candidates sieved per element, the window holds a prime with probability ~99.7%
+SIEVE_LIMIT = 1 << 14  # sieving primes are all the primes below this bound
+BLOCK_SIZE = 1024  # elements sieved together, bounds the memory of the sieve
+LIMB_BITS = 32
+
+
+def hash_to_bits(hex_string, num_of_bits=128):
+    hash_result = hashlib.sha256(bytes.fromhex(hex_string)).digest()
+    return int.from_bytes(hash_result[:num_of_bits // 8], byteorder='big')
+
+
+def hash_to_prime(x, num_of_bits=128, nonce=0):
+    start = hash_to_bits(x, num_of_bits)
+    while not is_prime(start + nonce):
+        nonce += 1
+    return start + nonce, nonce
+
+
+# Returns [(prime, nonce)] for every element of x_list, equal to [hash_to_prime(x, num_of_bits) for x in x_list].
+# num_of_bits must be large enough for the primes to be above SIEVE_LIMIT (a sieving prime marks itself).
+def batch_hash_to_prime(x_list, num_of_bits=128):
+    starts = [hash_to_bits(x, num_of_bits) for x in x_list]
+    results = []
+    for i in range(0, len(starts), BLOCK_SIZE):
+        results.extend(__sieve_block(starts[i:i + BLOCK_SIZE], num_of_bits))
+    return results
+
+
+def __sieve_block(starts, num_of_bits):
+    count = len(starts)
+    composite = np.zeros((count, SIEVE_WINDOW), dtype=bool)
+    rows = np.arange(count)[:, None]
+    residues = __residues(starts, num_of_bits)
+    # offset of the first multiple of every sieving prime in every window
+    first = (SIEVE_PRIMES_ARRAY[None, :].astype(np.int64) - residues) % SIEVE_PRIMES_ARRAY[None, :].astype(np.int64)
+
+    # primes smaller than the window hit every row several times
+    for k in range(SMALL_SIEVE_PRIMES):
+        marks = first[:, k:k + 1] + np.arange(0, SIEVE_WINDOW, SIEVE_PRIMES[k])[None, :]
+        valid = marks < SIEVE_WINDOW
+        composite[np.broadcast_to(rows, marks.shape)[valid], marks[valid]] = True
+
+    # the others hit every row at most once, all of them are marked at once
+    marks = first[:, SMALL_SIEVE_PRIMES:]
+    valid = marks < SIEVE_WINDOW
+    composite[np.broadcast_to(rows, marks.shape)[valid], marks[valid]] = True
+
+    results = []
+    for i, start in enumerate(starts):
+        prime = None
+        for nonce in np.flatnonzero(~composite[i]).tolist():
+            # the survivors have no factor below SIEVE_LIMIT, only the BPSW tests are left
+            candidate = start + nonce
+            if strong_probable_prime(candidate, 2) and strong_lucas_probable_prime(candidate):
+                prime = (start + nonce, nonce)
+                break
+        if prime is None:
+            # no prime in the window, continue the search one candidate at a time
+            nonce = SIEVE_WINDOW
+            while not is_prime(start + nonce):
+                nonce += 1
+            prime = (start + nonce, nonce)
+        results.append(prime)
+    return results
+
+
+# starts mod every sieving prime, as a (len(starts), len(SIEVE_PRIMES)) array. The integers are split into
+# 32-bit limbs and reduced with Horner's rule, every intermediate value stays below 2^48.
+def __residues(starts, num_of_bits):
+    num_of_limbs = -(-num_of_bits // LIMB_BITS)
+    mask = (1 << LIMB_BITS) - 1
+    limbs = np.array([[(start >> (LIMB_BITS * j)) & mask for j in range(num_of_limbs - 1, -1, -1)]
+                      for start in starts], dtype=np.uint64).reshape(len(starts), num_of_limbs)
+    primes = SIEVE_PRIMES_ARRAY[None, :]
+    residues = np.zeros((len(starts), len(SIEVE_PRIMES)), dtype=np.uint64)
+    for j in range(num_of_limbs):
+        residues = ((residues << np.uint64(LIMB_BITS)) + limbs[:, j:j + 1]) % primes
+    return residues.astype(np.int64)
+
+
+def __small_primes(limit):
+    sieve = np.ones(limit, dtype=bool)
+    sieve[:2] = False
+    for p in range(2, int(limit ** 0.5) + 1):
+        if sieve[p]:
+            sieve[p * p::p] = False
+    return np.flatnonzero(sieve)
+
+
+SIEVE_PRIMES_ARRAY = __small_primes(SIEVE_LIMIT).astype(np.uint64)
+SIEVE_PRIMES = SIEVE_PRIMES_ARRAY.tolist()
+SMALL_SIEVE_PRIMES = int(np.searchsorted(SIEVE_PRIMES_ARRAY, SIEVE_WINDOW))
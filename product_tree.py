@@ -0,0 +1,124 @@
+# Balanced product trees over lists of (prime) integers.
+# Multiplying the accumulated primes one at a time into a growing bigint costs quadratic time, while
+# multiplying pairs of similar size lets CPython's Karatsuba multiplication do the heavy lifting.
+#
+# A tree is kept as a list of levels: levels[0] holds the leaves (the values themselves), and
+# levels[i + 1][j] = levels[i][2j] * levels[i][2j + 1]. When a level has an odd length its last node
+# is carried up unchanged. levels[-1][0] is the product of all the values.
+
+
+def product_tree(values):
+    levels = [list(values)]
+    while len(levels[-1]) > 1:
+        levels.append(__next_level(levels[-1]))
+    return levels
+
+
+def calculate_product(lst):
+    level = list(lst)
+    if len(level) == 0:
+        return 1
+    while len(level) > 1:
+        level = __next_level(level)
+    return level[0]
+
+
+def tree_root(levels):
+    if len(levels[-1]) == 0:
+        return 1
+    return levels[-1][0]
+
+
+# Appends new leaves to an existing tree, recomputing only the nodes on the right edge that change.
+# Returns the updated levels (the list passed in is updated in place as well).
+def extend_product_tree(levels, values):
+    values = list(values)
+    if len(values) == 0:
+        return levels
+    first_changed = len(levels[0])
+    levels[0].extend(values)
+    level = 0
+    while len(levels[level]) > 1:
+        below = levels[level]
+        if level + 1 == len(levels):
+            levels.append([])
+        above = levels[level + 1]
+        first_changed //= 2
+        del above[first_changed:]
+        for j in range(2 * first_changed, len(below) - 1, 2):
+            above.append(below[j] * below[j + 1])
+        if len(below) % 2:
+            above.append(below[-1])
+        level += 1
+    del levels[level + 1:]
+    return levels
+
+
+# Rebuilds a tree from its leaves and its stored levels from first_level up (as saved with a checkpoint).
+# Only the levels below first_level are multiplied out again: those are the small products, the big
+# multiplications near the root are the ones the stored levels save.
+def restore_product_tree(values, upper_levels, first_level):
+    levels = [list(values)]
+    while len(levels) < first_level and len(levels[-1]) > 1:
+        levels.append(__next_level(levels[-1]))
+    if len(levels[-1]) <= 1:
+        if len(upper_levels) != 0:
+            raise ValueError("stored levels do not match the leaves")
+        return levels
+    upper_levels = [list(level) for level in upper_levels]
+    if len(upper_levels) == 0 or len(upper_levels[0]) != (len(levels[-1]) + 1) // 2 or len(upper_levels[-1]) != 1:
+        raise ValueError("stored levels do not match the leaves")
+    return levels + upper_levels
+
+
+# value mod every leaf, reduced down the tree: each node only reduces the remainder of its parent, so the
+# big reductions happen once near the root instead of once per leaf.
+def tree_remainders(value, levels):
+    if len(levels[0]) == 0:
+        return []
+    remainders = [value % levels[-1][0]]
+    for level in range(len(levels) - 2, -1, -1):
+        below = levels[level]
+        remainders = [remainders[j // 2] % below[j] for j in range(len(below))]
+    return remainders
+
+
+# root_factor over a product tree: returns [g^(product of all leaves except leaf i) for every leaf i].
+# Every node raises g to the product of its sibling subtree, which is read from the tree instead of
+# being recomputed at every level of the recursion.
+# g_power - optional function e -> g^e mod N (e.g. a fixed-base table of g), used for the exponentiations
+# of g itself at the top of the tree.
+def tree_root_factor(g, levels, N, g_power=None):
+    if len(levels[0]) == 0:
+        return []
+    return __tree_root_factor(g, levels, len(levels) - 1, 0, N, g_power)
+
+
+def __tree_root_factor(g, levels, level, index, N, g_power=None):
+    if level == 0:
+        return [g]
+
+    below = levels[level - 1]
+    left = 2 * index
+    right = left + 1
+    if right == len(below):
+        return __tree_root_factor(g, levels, level - 1, left, N, g_power)
+
+    if g_power is not None:
+        g_L = g_power(below[right])
+        g_R = g_power(below[left])
+    else:
+        g_L = pow(g, below[right], N)
+        g_R = pow(g, below[left], N)
+
+    L = __tree_root_factor(g_L, levels, level - 1, left, N)
+    R = __tree_root_factor(g_R, levels, level - 1, right, N)
+
+    return L + R
+
+
+def __next_level(level):
+    above = [level[j] * level[j + 1] for j in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        above.append(level[-1])
+    return above
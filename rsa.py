@@ -1,10 +1,9 @@
-from data import main
-from final import setup, batch_add, create_all_membership_witnesses,verify_membership
-import secrets , json
-
-n, A0, S = setup()
-
-transaction_hashes = main()
+from data import infura_url, start_block, end_block
+from allFunctions import prime_cache, setup_from_keystore, verify_membership
+from state_file import write_state
+from pipeline import ingest
+from witness_store import WitnessStore
+import secrets
 
 def ensure_even_length_hex(hex_str):
     if hex_str.startswith("0x"):
@@ -14,31 +13,26 @@ def ensure_even_length_hex(hex_str):
     return '0x' + hex_str
 
 
-x_values = [hash[2:] if hash.startswith('0x') else hash for hash in transaction_hashes]
-
-print("n",hex(n))
-print("A0",A0)
-print("S",S)
-
-print("x:",x_values)
-A1, Map = batch_add(A0,S,x_values,n)
-print("A1",A1)
-print("A1_hex",ensure_even_length_hex(hex(A1)))
-witness, map = create_all_membership_witnesses(A0,S,n)
-
-
-with open('witness.json', 'w') as f:
-    json.dump(map, f, indent=4, default=str) 
-
-with open('hashes.json', 'w') as f:
-    json.dump(Map, f, indent=4, default=str) 
-
-for i in range(len(x_values)) : 
- result,hash = verify_membership(A1,x_values[i],0,witness[i],n)
- print(result,hash)
-
+if __name__ == '__main__':
+    n, A0, S, _ = setup_from_keystore()
 
+    print("n",hex(n))
+    print("A0",A0)
+    print("S",S)
 
+    store = WitnessStore(A0,S,n)
+    # blocks are fetched, hashed to primes and accumulated as a stream, one block at a time
+    # (the hashing runs in a worker process, hence the __main__ guard)
+    A1 = ingest(infura_url, start_block, end_block, store)
+    x_values = list(S.keys())
+    print("x:",x_values)
+    print("A1",A1)
+    print("A1_hex",ensure_even_length_hex(hex(A1)))
 
 
+    write_state(n, A1, S, store.primes, store.witnesses)
+    prime_cache.save()
 
+    for x in x_values :
+        result = verify_membership(A1,x,S[x],store.get_witness(x),n)
+        print(result,store.primes[x])
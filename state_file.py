@@ -0,0 +1,104 @@
+# Binary state file for S, the primes and the membership witnesses.
+#
+# Layout (all integers big-endian):
+#   header:  magic (8 bytes) | record count (8 bytes) | n (384 bytes) | A (384 bytes)
+#   records: element (32 bytes) | prime (16 bytes) | nonce (16 bytes) | witness (384 bytes)
+# The records are sorted by element and have a fixed size, so a verifier opens the file with mmap and finds a
+# witness with a binary search, without parsing or loading the rest of the file.
+import mmap
+import struct
+
+MAGIC = b'RSAACC01'
+MODULUS_SIZE = 384  # 3072-bit modulus, accumulator and witnesses
+ELEMENT_SIZE = 32
+PRIME_SIZE = 16
+NONCE_SIZE = 16
+COUNT_FORMAT = '>Q'
+HEADER_SIZE = len(MAGIC) + struct.calcsize(COUNT_FORMAT) + 2 * MODULUS_SIZE
+RECORD_SIZE = ELEMENT_SIZE + PRIME_SIZE + NONCE_SIZE + MODULUS_SIZE
+STATE_PATH = 'state.bin'
+
+
+# S - x -> nonce, primes - x -> prime, witnesses - x -> witness. The elements are hex strings (transaction
+# hashes, with or without 0x) and the nonces are integers. The whole file is written with one write.
+def write_state(n, A, S, primes, witnesses, path=STATE_PATH):
+    records = sorted((element_to_bytes(x), x) for x in S.keys())
+    buffer = bytearray(HEADER_SIZE + RECORD_SIZE * len(records))
+    buffer[:HEADER_SIZE] = MAGIC + struct.pack(COUNT_FORMAT, len(records)) + \
+        n.to_bytes(MODULUS_SIZE, 'big') + A.to_bytes(MODULUS_SIZE, 'big')
+    offset = HEADER_SIZE
+    for key, x in records:
+        buffer[offset:offset + RECORD_SIZE] = key + primes[x].to_bytes(PRIME_SIZE, 'big') + \
+            S[x].to_bytes(NONCE_SIZE, 'big') + witnesses[x].to_bytes(MODULUS_SIZE, 'big')
+        offset += RECORD_SIZE
+    with open(path, 'wb') as f:
+        f.write(buffer)
+
+
+# The fixed-size record key of an element: left padded to ELEMENT_SIZE bytes. A longer element would shift every
+# record after it, so it is rejected.
+def element_to_bytes(x):
+    if x.startswith('0x'):
+        x = x[2:]
+    if len(x) > 2 * ELEMENT_SIZE:
+        raise ValueError(f"element {x} is longer than {ELEMENT_SIZE} bytes")
+    return bytes.fromhex(x.rjust(2 * ELEMENT_SIZE, '0'))
+
+
+class StateFile:
+    def __init__(self, path=STATE_PATH):
+        with open(path, 'rb') as f:
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.__map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("not an accumulator state file")
+        offset = len(MAGIC)
+        self.count = struct.unpack_from(COUNT_FORMAT, self.__map, offset)[0]
+        offset += struct.calcsize(COUNT_FORMAT)
+        self.n = int.from_bytes(self.__map[offset:offset + MODULUS_SIZE], 'big')
+        offset += MODULUS_SIZE
+        self.A = int.from_bytes(self.__map[offset:offset + MODULUS_SIZE], 'big')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.__map.close()
+
+    def __len__(self):
+        return self.count
+
+    # (prime, nonce, witness) of x, or None if x is not in the state
+    def lookup(self, x):
+        key = element_to_bytes(x)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER_SIZE + middle * RECORD_SIZE
+            current = self.__map[offset:offset + ELEMENT_SIZE]
+            if current == key:
+                return self.__record(offset)[1:]
+            if current < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    # (element, prime, nonce, witness) for every record, the element as a hex string
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.__record(HEADER_SIZE + i * RECORD_SIZE)
+
+    def __record(self, offset):
+        record = self.__map[offset:offset + RECORD_SIZE]
+        element = record[:ELEMENT_SIZE].hex()
+        offset = ELEMENT_SIZE
+        prime = int.from_bytes(record[offset:offset + PRIME_SIZE], 'big')
+        offset += PRIME_SIZE
+        nonce = int.from_bytes(record[offset:offset + NONCE_SIZE], 'big')
+        offset += NONCE_SIZE
+        witness = int.from_bytes(record[offset:], 'big')
+        return element, prime, nonce, witness
@@ -0,0 +1,59 @@
+# Trapdoor of the accumulator manager: the factorization n = p*q.
+# A trusted manager that keeps p and q can reduce every exponent mod lambda(n) = lcm(p - 1, q - 1) and
+# split each exponentiation into two half-size ones (mod p and mod q) that are recombined with the CRT.
+# Verifiers never get the trapdoor, they keep using the plain pow(base, exponent, n).
+from math import gcd
+
+
+class Trapdoor:
+    def __init__(self, p, q):
+        self.p = p
+        self.q = q
+        self.n = p * q
+        self.lam = (p - 1) * (q - 1) // gcd(p - 1, q - 1)
+        self.q_inv = pow(q, -1, p)  # CRT coefficient
+
+    # a smaller exponent e' with base^e' == base^e (mod n) for every base, including non-units
+    def reduce(self, exponent):
+        if exponent < self.lam:
+            return exponent
+        return exponent % self.lam + self.lam
+
+    # pow(base, exponent, n) for a non-negative exponent, computed with two half-size exponentiations.
+    def pow(self, base, exponent):
+        if exponent == 0:
+            return 1 % self.n
+        base_p = base % self.p
+        base_q = base % self.q
+        # base not a unit: the result is 0 in that component, reducing the exponent would break that
+        x_p = pow(base_p, exponent % (self.p - 1), self.p) if base_p != 0 else 0
+        x_q = pow(base_q, exponent % (self.q - 1), self.q) if base_q != 0 else 0
+        return self.__crt(x_p, x_q)
+
+    # the exponent-th root of base: base^(exponent^-1 mod lambda(n)). Used for deletions - removing an
+    # element (or a batch, with the product of their primes) is one root of the current accumulator.
+    def root(self, base, exponent):
+        return self.pow(base, self.inverse(exponent))
+
+    def inverse(self, exponent):
+        if gcd(exponent, self.lam) != 1:
+            raise ValueError("exponent is not invertible mod lambda(n)")
+        return pow(exponent, -1, self.lam)
+
+    # [g^(product of all primes except primes[i]) for every i], using prefix and suffix products mod
+    # lambda(n) - O(n) small multiplications and O(n) half-size exponentiations.
+    def root_factor(self, g, primes):
+        k = len(primes)
+        suffix = [1] * (k + 1)
+        for i in range(k - 1, -1, -1):
+            suffix[i] = suffix[i + 1] * primes[i] % self.lam
+        witnesses = []
+        prefix = 1
+        for i in range(k):
+            witnesses.append(self.pow(g, prefix * suffix[i + 1] % self.lam + self.lam))
+            prefix = prefix * primes[i] % self.lam
+        return witnesses
+
+    def __crt(self, x_p, x_q):
+        h = (x_p - x_q) * self.q_inv % self.p
+        return x_q + h * self.q
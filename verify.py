@@ -1,29 +1,25 @@
-import json
-from final import hash_to_128_bits,hash_to_prime
+from state_file import StateFile
 
-file_path = 'C:/Users/Aksha/rsa/witness.json'
-file_path_1 = 'C:/Users/Aksha/rsa/hashes.json'
+file_path = 'state.bin'
 
-with open(file_path, 'r') as file:
-    witness_data = json.load(file)
-
-with open(file_path_1, 'r') as file:
-    hash_data = json.load(file)
 
 def number_to_padded_hex(number):
     hex_str = hex(number)[2:]
 
     padded_hex_str = hex_str.zfill(64)
-    
-    return '0x' + padded_hex_str
 
-def get_value(pair_key):
-    witness = witness_data.get(pair_key, "Key not found") , hash_to_prime(pair_key)
-    exponent = hash_data.get(pair_key, "Key not found") , hash_to_prime(pair_key)
-
-    return witness ,exponent
+    return '0x' + padded_hex_str
 
-input = input("Enter a string: ")
-witness , exponent = get_value(input)
-print("witness",hex(witness[0]))
-print("exponent",number_to_padded_hex(exponent[0]))
\ No newline at end of file
+# the state file is memory-mapped, a lookup only reads the records of its binary search
+def get_value(state, pair_key):
+    record = state.lookup(pair_key)
+    if record is None:
+        raise KeyError(pair_key)
+    exponent, nonce, witness = record
+    return witness, exponent
+
+with StateFile(file_path) as state:
+    input = input("Enter a string: ")
+    witness , exponent = get_value(state, input)
+    print("witness",hex(witness))
+    print("exponent",number_to_padded_hex(exponent))
@@ -0,0 +1,36 @@
+# Aggregation of membership witnesses with Shamir's trick, pairwise in a balanced tree.
+#
+# shamir_trick(w1, w2, x1, x2) returns the witness of x1 * x2 from the witnesses of x1 and x2, with exponents of the
+# size of x1 and x2. Folding k witnesses left to right makes the i-th step work with the product of i primes,
+# O(k^2) bits of exponents in total. Combining neighbours level by level (like product_tree) keeps both sides of
+# every step the same size: O(k log k) bits in total, and the steps of a level are independent, so they run on
+# the process pool of parallel_pow.
+from helpfunctions import shamir_trick
+from parallel_pow import get_pool
+
+PARALLEL_AGGREGATION_CUTOFF = 4  # levels with fewer pairs are combined in this process
+
+
+# (witness of prod(exponents), prod(exponents)) for witnesses[i]^(exponents[i]) == A, the exponents pairwise coprime.
+# workers - processes for the levels of the tree (1 = in this process)
+def aggregate_witnesses(witnesses, exponents, n, workers=1):
+    witnesses = list(witnesses)
+    exponents = list(exponents)
+    if len(witnesses) == 0:
+        return None, 1
+    while len(witnesses) > 1:
+        pairs = len(witnesses) // 2
+        lefts, rights = witnesses[0:2 * pairs:2], witnesses[1:2 * pairs:2]
+        left_exponents, right_exponents = exponents[0:2 * pairs:2], exponents[1:2 * pairs:2]
+        if workers > 1 and pairs >= PARALLEL_AGGREGATION_CUTOFF:
+            chunk_size = max(1, pairs // (4 * workers))
+            combined = list(get_pool(workers).map(shamir_trick, lefts, rights, left_exponents, right_exponents,
+                                                  [n] * pairs, chunksize=chunk_size))
+        else:
+            combined = [shamir_trick(*pair, n) for pair in zip(lefts, rights, left_exponents, right_exponents)]
+        products = [x1 * x2 for x1, x2 in zip(left_exponents, right_exponents)]
+        if len(witnesses) % 2:
+            combined.append(witnesses[-1])
+            products.append(exponents[-1])
+        witnesses, exponents = combined, products
+    return witnesses[0], exponents[0]
@@ -0,0 +1,168 @@
+# Keeps the membership witnesses of every element of S up to date while elements are added,
+# instead of regenerating all of them with create_all_membership_witnesses after every ingest.
+#
+# On batch_add of new elements with primes p_1..p_k (P = p_1*...*p_k):
+#   - every existing witness w (w^x = A) becomes w^P, since the new accumulator is A^P
+#   - the witnesses of the new elements are root_factor(A, [p_1..p_k]) - a small tree over the delta only
+# so the cost of an ingest depends on the size of the batch, not on the whole history of S.
+#
+# On delete/batch_delete the witness (aggregated witness) of the deleted elements is the new accumulator,
+# and the other witnesses are updated with Bezout coefficients - no trapdoor and no rebuild from A0.
+# A store created with the trapdoor instead takes one root of the accumulator and of every witness by the
+# product of the deleted primes.
+from allFunctions import ACCUMULATED_PRIME_SIZE, create_all_membership_witnesses, root_factor, element_prime,\
+    fixed_base_tables, prime_cache, member_product, delete_using_membership_proof,\
+    batch_delete_using_membership_proofs_without_NIPoE, update_membership_witnesses_on_delete
+from helpfunctions import hash_to_prime
+from parallel_pow import get_pool
+from product_tree import calculate_product, product_tree, tree_root, extend_product_tree
+
+
+class WitnessStore:
+    # S - x -> nonce, as returned by setup(). Elements already in S get their witnesses computed here.
+    # workers - number of processes used to update the existing witnesses (1 = in this process)
+    def __init__(self, A0, S, n, trapdoor=None, workers=1):
+        self.A0 = A0
+        self.n = n
+        self.S = S
+        self.trapdoor = trapdoor
+        self.workers = workers
+        self.primes = {x: element_prime(x, S[x]) for x in S.keys()}
+        self.tree = product_tree(self.primes.values())
+        self.witnesses = dict(zip(S.keys(), create_all_membership_witnesses(A0, S, n, self.tree, trapdoor)))
+        self.A = self.__power(A0, tree_root(self.tree))
+
+    # Restores a store from saved state (a checkpoint) without computing any witness: A is the accumulator,
+    # primes - x -> prime and witnesses - x -> witness for every element of S, tree the product tree of the
+    # primes in the order of S (e.g. from restore_product_tree).
+    @classmethod
+    def restore(cls, A0, A, S, primes, witnesses, tree, n, trapdoor=None, workers=1):
+        store = cls.__new__(cls)
+        store.A0 = A0
+        store.n = n
+        store.S = S
+        store.trapdoor = trapdoor
+        store.workers = workers
+        store.primes = {x: primes[x] for x in S.keys()}
+        store.tree = tree
+        store.witnesses = {x: witnesses[x] for x in S.keys()}
+        store.A = A
+        return store
+
+    def add(self, x):
+        return self.batch_add([x])
+
+    # known_primes - x -> (prime, nonce) of elements whose prime is already known (e.g. from a checkpoint log)
+    def batch_add(self, x_list, known_primes=None):
+        new_primes = {}
+        for x in x_list:
+            if x not in self.S.keys() and x not in new_primes:
+                if known_primes is not None and x in known_primes:
+                    hash_prime, nonce = known_primes[x]
+                else:
+                    hash_prime, nonce = hash_to_prime(x, ACCUMULATED_PRIME_SIZE)
+                prime_cache.put(x, hash_prime, nonce)
+                self.S[x] = nonce
+                new_primes[x] = hash_prime
+        if len(new_primes) == 0:
+            return self.A
+
+        delta_tree = product_tree(new_primes.values())
+        product = tree_root(delta_tree)
+
+        self.__raise_witnesses(product)
+        new_witnesses = root_factor(self.A, list(new_primes.values()), self.n, delta_tree, self.trapdoor)
+        self.witnesses.update(zip(new_primes.keys(), new_witnesses))
+
+        self.primes.update(new_primes)
+        extend_product_tree(self.tree, new_primes.values())
+        self.A = self.__power(self.A, product)
+        return self.A
+
+    def delete(self, x):
+        return self.batch_delete([x])
+
+    def batch_delete(self, x_list):
+        x_list = [x for x in dict.fromkeys(x_list) if x in self.S.keys()]
+        if len(x_list) == 0:
+            return self.A
+
+        proofs = [self.witnesses.pop(x) for x in x_list]
+        deleted_primes = [self.primes.pop(x) for x in x_list]
+        if self.trapdoor is not None:
+            return self.__trapdoor_delete(x_list, calculate_product(deleted_primes))
+
+        if len(x_list) == 1:
+            A_post_delete = delete_using_membership_proof(self.A, self.S, x_list[0], proofs[0], self.n)
+        else:
+            A_post_delete, _ = batch_delete_using_membership_proofs_without_NIPoE(self.A, self.S, x_list, proofs,
+                                                                                  self.n, workers=self.workers)
+        member_product.invalidate()
+
+        keys = list(self.witnesses.keys())
+        primes = [self.primes[x] for x in keys]
+        updated = self.__map_chunks(update_membership_witnesses_on_delete, A_post_delete,
+                                    list(self.witnesses.values()), primes, calculate_product(deleted_primes),
+                                    self.n)
+        self.witnesses = dict(zip(keys, updated))
+
+        self.tree = product_tree(self.primes.values())
+        self.A = A_post_delete
+        return self.A
+
+    def __trapdoor_delete(self, x_list, deleted_product):
+        for x in x_list:
+            del self.S[x]
+        member_product.invalidate()
+        inverse = self.trapdoor.inverse(deleted_product)
+        keys = list(self.witnesses.keys())
+        updated = self.__map_chunks(raise_all, list(self.witnesses.values()), inverse, self.n, self.trapdoor)
+        self.witnesses = dict(zip(keys, updated))
+
+        self.tree = product_tree(self.primes.values())
+        self.A = self.trapdoor.pow(self.A, inverse)
+        return self.A
+
+    def get_witness(self, x):
+        return self.witnesses.get(x)
+
+    # every existing witness gets raised to the product of the newly added primes
+    def __raise_witnesses(self, product):
+        if self.trapdoor is not None:
+            product = self.trapdoor.reduce(product)
+
+        keys = list(self.witnesses.keys())
+        raised = self.__map_chunks(raise_all, list(self.witnesses.values()), product, self.n, self.trapdoor)
+        self.witnesses = dict(zip(keys, raised))
+
+    # Runs function(*args) where list arguments are split into one chunk per worker process of the pool of
+    # parallel_pow, and concatenates the returned lists. Runs in this process for a single worker or a small input.
+    def __map_chunks(self, function, *args):
+        size = max(len(arg) for arg in args if isinstance(arg, list))
+        if self.workers <= 1 or size < 2 * self.workers:
+            return function(*args)
+
+        chunk_size = -(-size // self.workers)
+        chunked_args = []
+        for arg in args:
+            if isinstance(arg, list):
+                chunked_args.append([arg[i:i + chunk_size] for i in range(0, size, chunk_size)])
+            else:
+                chunked_args.append([arg] * self.workers)
+        results = get_pool(self.workers).map(function, *chunked_args)
+        return [item for result in results for item in result]
+
+    def __power(self, base, exponent):
+        if self.trapdoor is not None:
+            return self.trapdoor.pow(base, exponent)
+        table = fixed_base_tables.get((base, self.n))
+        if table is not None:
+            return table.pow(exponent)
+        return pow(base, exponent, self.n)
+
+
+# module level so that it can be sent to worker processes
+def raise_all(witnesses, exponent, n, trapdoor=None):
+    if trapdoor is None:
+        return [pow(w, exponent, n) for w in witnesses]
+    return [trapdoor.pow(w, exponent) for w in witnesses]
@@ -0,0 +1,99 @@
+# root_factor that streams the witnesses out instead of returning them all in one list.
+#
+# The tree is walked depth-first: every node keeps only its own base on the stack while the subtree on its left
+# is done, and every witness goes to the sink as soon as its leaf is reached. Without a stored product tree the
+# sibling products are multiplied out when they are needed and dropped right after the exponentiation, so
+# besides the primes themselves only O(log n) products and bases are alive at any time. This multiplies every
+# level of the tree out again (about log n times the cost of product_tree), which is small next to the
+# exponentiations.
+#
+# The nodes are the same as product_tree's (node j of level i covers the leaves [j * 2^i, (j + 1) * 2^i)), so a
+# stored tree can be passed in as levels to skip the multiplications.
+import mmap
+import os
+
+from product_tree import calculate_product
+from state_file import MODULUS_SIZE
+
+WITNESS_FILE_PATH = 'witnesses.bin'
+
+
+# Calls sink(i, witness) with g^(product of all primes except primes[i]) for every i, in increasing i.
+# g_power - optional function e -> g^e mod N (e.g. a fixed-base table of g) for the exponentiations of g itself
+# levels - optional product tree of primes (product_tree.product_tree)
+def stream_root_factor(g, primes, N, sink, g_power=None, levels=None):
+    if len(primes) == 0:
+        return
+    height = (len(primes) - 1).bit_length()
+    __stream_node(g, primes, N, sink, height, 0, g_power, levels)
+
+
+def __stream_node(g, primes, N, sink, level, index, g_power, levels):
+    lo = index << level
+    if level == 0:
+        sink(lo, g)
+        return
+
+    mid = lo + (1 << (level - 1))
+    if mid >= len(primes):
+        __stream_node(g, primes, N, sink, level - 1, 2 * index, g_power, levels)
+        return
+    hi = min(lo + (1 << level), len(primes))
+
+    # g is all this frame keeps while the left subtree runs, the right base is made only afterwards
+    power = g_power if g_power is not None else lambda e: pow(g, e, N)
+    right_product = levels[level - 1][2 * index + 1] if levels is not None else calculate_product(primes[mid:hi])
+    g_L = power(right_product)
+    del right_product
+    __stream_node(g_L, primes, N, sink, level - 1, 2 * index, None, levels)
+    del g_L
+
+    left_product = levels[level - 1][2 * index] if levels is not None else calculate_product(primes[lo:mid])
+    g_R = power(left_product)
+    del left_product
+    __stream_node(g_R, primes, N, sink, level - 1, 2 * index + 1, None, levels)
+
+
+# Fixed-size witnesses in leaf order (witness i at i * width, big-endian), mapped with mmap.
+# WitnessFile(path, count) creates the file for count witnesses and is a sink for stream_root_factor,
+# WitnessFile(path) opens an existing file for reading. witness_file[i] returns witness i.
+class WitnessFile:
+    def __init__(self, path=WITNESS_FILE_PATH, count=None, width=MODULUS_SIZE):
+        self.width = width
+        if count is not None:
+            with open(path, 'w+b') as f:
+                f.truncate(count * width)
+                self.__map = mmap.mmap(f.fileno(), 0) if count else None
+            self.count = count
+        else:
+            self.count = os.path.getsize(path) // width
+            with open(path, 'rb') as f:
+                self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.count else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __call__(self, index, witness):
+        offset = index * self.width
+        self.__map[offset:offset + self.width] = witness.to_bytes(self.width, 'big')
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("witness index out of range")
+        offset = index * self.width
+        return int.from_bytes(self.__map[offset:offset + self.width], 'big')
+
+    def flush(self):
+        if self.__map is not None:
+            self.__map.flush()
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None